@@ -1,18 +1,73 @@
-from flask import Flask, jsonify, request
+import json
+import math
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
+from services.db_service import get_db_stats, warm_rank_index, load_sketches, get_leaderboard as get_game_leaderboard
+from services.db_service import get_score_trend, get_user_history, refresh_rank_index
+from services import leaderboard_cache, instrumentation
+from services.db_service import determine_tier
+from services.stats_service import PERCENTILE_MODE, STATS_DATA, calculate_percentile
+from services.ingest_service import QueueFull, enqueue_score, get_ingest_stats
+from services.rank_index import GameRanking, get_player_rank
+from services.percentile_engine import calculate_percentiles
+
+MAX_BATCH_ITEMS = 10000
+
+# 게임 컴포넌트가 호출하는 /api/score/<slug> → game_type
+SCORE_ROUTES = {
+    'chimp': 'chimp_test',
+    'chimp-hard': 'chimp_test_hard',
+    'aim-hard': 'aim_hard',
+    'math-fall': 'math_fall',
+    'n-back': 'n_back',
+    'sequence-hard': 'sequence_hard',
+    'stroop-hard': 'stroop_hard',
+    'type-flow': 'type_flow',
+    'verbal-hard': 'verbal_hard',
+    'visual-hard': 'visual_hard',
+}
 
 app = Flask(__name__)
 CORS(app) # 프론트엔드에서 요청 허용
+# 라우트별 지연 히스토그램 + 느린 요청 프로파일 (BRAIN_INSTRUMENT=1일 때만)
+instrumentation.init_app(app)
 
 # 임시 저장소 (나중에는 진짜 DB로 교체해야 함)
-LEADERBOARD_DATA = [
+# 이름당 최고 점수 하나만 유지, 순위 조회는 O(log n)
+LEADERBOARD_DATA = GameRanking()
+for seed in [
     {"name": "Alpha", "score": 250, "tier": "Alien"},
     {"name": "Beta", "score": 120, "tier": "Chimp"},
-]
+]:
+    LEADERBOARD_DATA.update(seed["name"], seed["score"], seed)
+
+# user_stats 기반 게임별 순위 인덱스 준비
+warm_rank_index()
+# 실제 플레이 기록 기반 백분위 (BRAIN_PERCENTILE_MODE=empirical)
+if PERCENTILE_MODE == 'empirical':
+    load_sketches()
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "ok"})
+    return jsonify({"status": "ok", "db": get_db_stats(),
+                    "leaderboard_cache": leaderboard_cache.get_cache_stats(),
+                    "ingest": get_ingest_stats()})
+
+# Prometheus 스크랩용 (히스토그램은 BRAIN_INSTRUMENT=1일 때만 채워짐)
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    stats = {}
+    stats.update(instrumentation.flatten_stats('brain_db', get_db_stats(), counters=(
+        'connections_opened', 'pool_hits', 'lock_waits', 'lock_retries', 'lock_failures')))
+    stats.update(instrumentation.flatten_stats('brain_leaderboard_cache', leaderboard_cache.get_cache_stats(), counters=(
+        'hits', 'misses', 'invalidations', 'evictions')))
+    stats.update(instrumentation.flatten_stats('brain_ingest', get_ingest_stats(), counters=(
+        'enqueued', 'rejected', 'replayed', 'batches', 'rows_written', 'rows_failed', 'flush_errors')))
+    return Response(instrumentation.render_prometheus(stats), mimetype='text/plain; version=0.0.4')
+
+def read_json():
+    with instrumentation.span('json_parse'):
+        return request.get_json(silent=True) or {}
 
 # 1. 점수 저장하기 (프론트에서 이 주소로 점수를 보냄)
 @app.route('/api/submit-score', methods=['POST'])
@@ -24,18 +79,125 @@ def submit_score():
         "score": data.get("score", 0),
         "tier": data.get("tier", "Beginner")
     }
-    # 저장소에 추가
-    LEADERBOARD_DATA.append(new_record)
+    # 저장소에 추가 (기존 기록보다 좋을 때만 갱신) 후 순위 계산
+    name = str(new_record["name"])  # 순위 키는 (점수, 이름) — 숫자 이름과 문자열 이름은 비교 불가
+    existing = LEADERBOARD_DATA.get(name)
+    if existing is None or new_record["score"] > existing["score"]:
+        rank = LEADERBOARD_DATA.update(name, new_record["score"], new_record)
+    else:
+        rank = LEADERBOARD_DATA.rank(name)
     
-    # 점수 높은 순으로 정렬
-    LEADERBOARD_DATA.sort(key=lambda x: x['score'], reverse=True)
-    
-    return jsonify({"message": "Score saved!", "rank": LEADERBOARD_DATA.index(new_record) + 1})
+    return jsonify({"message": "Score saved!", "rank": rank})
 
 # 2. 리더보드 보여주기
+# game_type이 있으면 DB 리더보드 (JSON 바이트 캐시 + ETag/304)
 @app.route('/api/leaderboard', methods=['GET'])
 def get_leaderboard():
-    return jsonify(LEADERBOARD_DATA[:10]) # 상위 10등까지만 보냄
+    game_type = request.args.get('game_type')
+    if not game_type:
+        return jsonify(LEADERBOARD_DATA.top(10)) # 상위 10등까지만 보냄
+
+    body, etag, generation = leaderboard_cache.get(game_type)
+    if body is None:
+        rows = get_game_leaderboard(game_type, leaderboard_cache.LEADERBOARD_LIMIT)
+        if rows is None:
+            # Never cache a failed read as an empty board
+            return jsonify({"error": "Leaderboard temporarily unavailable"}), 503, {"Retry-After": "1"}
+        body = json.dumps(rows, separators=(',', ':')).encode()
+        etag = leaderboard_cache.put(game_type, body, generation)
+
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
+# 3. 내 순위 + 주변 순위 (예: 90,000명 중 4,312등)
+@app.route('/api/rank', methods=['GET'])
+def get_rank():
+    game_type = request.args.get('game_type', '')
+    user_id = request.args.get('user_id', '')
+    radius = max(1, min(request.args.get('radius', 5, type=int), 50))
+    refresh_rank_index()  # 다른 워커가 저장한 기록 반영 (몇 초에 한 번)
+    result = get_player_rank(game_type, user_id, radius)
+    if result is None:
+        return jsonify({"error": "No ranked score for this user"}), 404
+    return jsonify(result)
+
+# 4. 여러 점수의 백분위를 한 번에 계산
+# body: {"items": [{"game_type": "reaction_time", "score": 250}, ...]}
+@app.route('/api/percentile/batch', methods=['POST'])
+def percentile_batch():
+    data = read_json()
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list) or len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"items must be a list of at most {MAX_BATCH_ITEMS} entries"}), 400
+    try:
+        game_types = [str(item.get("game_type", "")) for item in items]
+        scores = [float(item.get("score", 0)) for item in items]
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({"error": "each item needs a game_type and a numeric score"}), 400
+    if not all(math.isfinite(score) for score in scores):
+        return jsonify({"error": "each item needs a game_type and a numeric score"}), 400
+
+    percentiles = calculate_percentiles(game_types, scores) if items else []
+    return jsonify({"percentiles": [float(p) for p in percentiles]})
+
+# 5. 게임별 일간/주간 추이 (rollup 테이블에서 조회)
+@app.route('/api/trends', methods=['GET'])
+def get_trends():
+    game_type = request.args.get('game_type', '')
+    period = request.args.get('period', 'day')
+    try:
+        trend = get_score_trend(game_type, period, request.args.get('start'), request.args.get('end'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(trend)
+
+# 6. 내 최근 플레이 기록
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    game_type = request.args.get('game_type', '')
+    user_id = request.args.get('user_id', '')
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    return jsonify(get_user_history(user_id, game_type, limit))
+
+# 7. 게임 결과 제출: 검증 + 백분위 계산 후 바로 응답, DB 저장은 백그라운드 큐에서
+def ingest_score(game_type, data):
+    if game_type not in STATS_DATA:
+        return jsonify({"error": f"Unknown game_type: {game_type}"}), 400
+    try:
+        score = float(data.get("score"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "score must be a number"}), 400
+    if not math.isfinite(score):
+        return jsonify({"error": "score must be a number"}), 400
+    user_id = str(data.get("username") or data.get("user_id") or "Anonymous")[:64]
+
+    percentile = calculate_percentile(game_type, score)
+    try:
+        with instrumentation.span('ingest_enqueue'):
+            enqueue_score(user_id, game_type, score)
+    except QueueFull:
+        return jsonify({"error": "Too many submissions, retry shortly"}), 503, {"Retry-After": "1"}
+    return jsonify({"percentile": percentile, "tier": determine_tier(game_type, score), "queued": True})
+
+@app.route('/api/score/<slug>', methods=['POST'])
+def submit_game_score(slug):
+    data = read_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "body must be a JSON object"}), 400
+    if slug == 'schulte':
+        game_type = f"schulte_{data.get('mode', 'normal')}"
+    else:
+        game_type = SCORE_ROUTES.get(slug, '')
+    return ingest_score(game_type, data)
+
+@app.route('/api/cognitive/analyze', methods=['POST'])
+def analyze_score():
+    data = read_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "body must be a JSON object"}), 400
+    return ingest_score(str(data.get("game_type", "")), data)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,90 @@
+"""
+Percentile microbenchmark: cold import time and per-score latency for
+
+  scipy   - scipy.stats.norm.cdf per score (the previous implementation; skipped if scipy is absent)
+  scalar  - stats_service.calculate_percentile (closed-form erf)
+  batch   - percentile_engine.calculate_percentiles over one NumPy array
+
+Usage (from backend/):
+    python benchmarks/bench_percentile.py [--n 100000]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.stats_service import STATS_DATA, calculate_percentile
+
+
+def import_time(statement, repeat=3):
+    # Fresh interpreter per run so module caches do not hide the cost
+    best = None
+    for _ in range(repeat):
+        code = f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"
+        out = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR,
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            return None
+        elapsed = float(out.stdout.strip())
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def scipy_percentile(norm, game_type, score):
+    data = STATS_DATA[game_type]
+    cdf = norm.cdf(score, loc=data['mean'], scale=data['std_dev']) * 100
+    return round(100 - cdf if data['lower_is_better'] else cdf, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    game_types = [rng.choice(list(STATS_DATA)) for _ in range(args.n)]
+    scores = [rng.gauss(STATS_DATA[g]['mean'], STATS_DATA[g]['std_dev']) for g in game_types]
+
+    print("import time (best of 3, fresh interpreter)")
+    for label, statement in [
+        ('scipy.stats', 'import scipy.stats'),
+        ('stats_service', 'import services.stats_service'),
+        ('percentile_engine', 'import services.percentile_engine'),
+    ]:
+        elapsed = import_time(statement)
+        shown = 'n/a' if elapsed is None else f"{elapsed * 1000:.1f} ms"
+        print(f"  {label:<18} {shown}")
+
+    print(f"\nper-score latency over {args.n} scores")
+    results = {}
+    try:
+        from scipy.stats import norm
+        start = time.perf_counter()
+        results['scipy'] = [scipy_percentile(norm, g, s) for g, s in zip(game_types, scores)]
+        print(f"  {'scipy':<18} {(time.perf_counter() - start) / args.n * 1e6:.3f} us")
+    except ImportError:
+        print(f"  {'scipy':<18} n/a (not installed)")
+
+    start = time.perf_counter()
+    results['scalar'] = [calculate_percentile(g, s) for g, s in zip(game_types, scores)]
+    print(f"  {'scalar':<18} {(time.perf_counter() - start) / args.n * 1e6:.3f} us")
+
+    from services.percentile_engine import calculate_percentiles
+    start = time.perf_counter()
+    results['batch'] = calculate_percentiles(game_types, scores).tolist()
+    print(f"  {'batch':<18} {(time.perf_counter() - start) / args.n * 1e6:.3f} us")
+
+    reference = results.get('scipy', results['scalar'])
+    for label, values in results.items():
+        mismatches = sum(1 for a, b in zip(reference, values) if a != b)
+        if mismatches:
+            print(f"  WARNING: {label} differs from reference on {mismatches} scores")
+
+
+if __name__ == '__main__':
+    main()
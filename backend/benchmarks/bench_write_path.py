@@ -0,0 +1,168 @@
+"""
+Compares score-submission write paths:
+
+  legacy  - connect per call, INSERT + SELECT + UPDATE/INSERT, default journal
+  upsert  - persistent WAL connection, single-statement UPSERT
+  threads - upsert path from concurrent threads, one connection each
+  group   - same threads, with group commit enabled
+
+Usage (from backend/):
+    python benchmarks/bench_write_path.py [--sizes 1000,10000,100000] [--threads 64]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import init_db
+from services import db_service
+from services.stats_service import STATS_DATA
+
+GAME_TYPES = list(STATS_DATA.keys())
+
+
+def make_submissions(n, users=1000, seed=42):
+    rng = random.Random(seed)
+    subs = []
+    for _ in range(n):
+        game_type = rng.choice(GAME_TYPES)
+        data = STATS_DATA[game_type]
+        score = max(0.0, rng.gauss(data['mean'], data['std_dev']))
+        subs.append((f"user_{rng.randrange(users)}", game_type, round(score, 2)))
+    return subs
+
+
+def fresh_db(directory, name):
+    path = os.path.join(directory, name)
+    init_db.DB_NAME = path
+    with redirect_stdout(StringIO()):
+        init_db.init_db()
+    return path
+
+
+def legacy_save(db_path, user_id, game_type, score):
+    # The pre-UPSERT implementation, kept here only as a baseline
+    lower_is_better = STATS_DATA[game_type].get('lower_is_better', False)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    try:
+        c.execute('INSERT INTO game_logs (user_id, game_type, score) VALUES (?, ?, ?)',
+                  (user_id, game_type, score))
+        c.execute('SELECT best_score, total_plays FROM user_stats WHERE user_id = ? AND game_type = ?',
+                  (user_id, game_type))
+        row = c.fetchone()
+        if row:
+            new_best = min(score, row['best_score']) if lower_is_better else max(score, row['best_score'])
+            c.execute('''
+                UPDATE user_stats
+                SET best_score = ?, total_plays = ?, tier = ?, last_played_at = CURRENT_TIMESTAMP
+                WHERE user_id = ? AND game_type = ?
+            ''', (new_best, row['total_plays'] + 1, db_service.determine_tier(game_type, new_best),
+                  user_id, game_type))
+        else:
+            c.execute('''
+                INSERT INTO user_stats (user_id, game_type, best_score, total_plays, tier)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, game_type, score, 1, db_service.determine_tier(game_type, score)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def use_db(path, group_commit_ms=0):
+    db_service.close_db_connection()
+    db_service.DB_PATH = path
+    db_service.GROUP_COMMIT_MS = group_commit_ms
+    db_service._group_writer = None
+
+
+def run_legacy(path, subs):
+    start = time.perf_counter()
+    for user_id, game_type, score in subs:
+        legacy_save(path, user_id, game_type, score)
+    return time.perf_counter() - start
+
+
+def run_upsert(path, subs):
+    use_db(path)
+    start = time.perf_counter()
+    for user_id, game_type, score in subs:
+        db_service.save_game_result(user_id, game_type, score)
+    return time.perf_counter() - start
+
+
+def run_threaded(path, subs, threads, group_commit_ms=0):
+    use_db(path, group_commit_ms=group_commit_ms)
+
+    def worker(chunk):
+        for user_id, game_type, score in chunk:
+            db_service.save_game_result(user_id, game_type, score)
+
+    chunks = [subs[i::threads] for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    use_db(path)
+    return elapsed
+
+
+def check_same_stats(a, b):
+    query = 'SELECT user_id, game_type, best_score, total_plays, tier FROM user_stats ORDER BY 1, 2'
+    rows_a = sqlite3.connect(a).execute(query).fetchall()
+    rows_b = sqlite3.connect(b).execute(query).fetchall()
+    return rows_a == rows_b
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--interval-ms', type=int, default=2)
+    parser.add_argument('--skip-legacy-above', type=int, default=100000,
+                        help='legacy path fsyncs per row; skip it for larger runs')
+    args = parser.parse_args()
+
+    print(f"{'n':>8} {'path':>8} {'seconds':>9} {'rows/s':>10}")
+    for n in [int(x) for x in args.sizes.split(',')]:
+        subs = make_submissions(n)
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {}
+            if n <= args.skip_legacy_above:
+                paths['legacy'] = fresh_db(tmp, 'legacy.db')
+                elapsed = run_legacy(paths['legacy'], subs)
+                print(f"{n:>8} {'legacy':>8} {elapsed:>9.3f} {n / elapsed:>10.0f}")
+
+            paths['upsert'] = fresh_db(tmp, 'upsert.db')
+            elapsed = run_upsert(paths['upsert'], subs)
+            print(f"{n:>8} {'upsert':>8} {elapsed:>9.3f} {n / elapsed:>10.0f}")
+
+            paths['threads'] = fresh_db(tmp, 'threads.db')
+            elapsed = run_threaded(paths['threads'], subs, args.threads)
+            print(f"{n:>8} {'threads':>8} {elapsed:>9.3f} {n / elapsed:>10.0f}")
+
+            paths['group'] = fresh_db(tmp, 'group.db')
+            elapsed = run_threaded(paths['group'], subs, args.threads, args.interval_ms)
+            print(f"{n:>8} {'group':>8} {elapsed:>9.3f} {n / elapsed:>10.0f}")
+
+            if 'legacy' in paths and not check_same_stats(paths['legacy'], paths['upsert']):
+                print("  WARNING: legacy and upsert paths produced different user_stats")
+            if not check_same_stats(paths['upsert'], paths['group']):
+                print("  WARNING: upsert and group paths produced different user_stats")
+            db_service.close_db_connection()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,446 @@
+"""
+Load-test harness for the backend API and DB layer.
+
+Seeds a throwaway database, drives a mixed read/write workload and prints a
+JSON report (throughput, p50/p95/p99 latency per operation, DB file growth).
+
+Targets:
+  functions - db_service.save_game_result / get_leaderboard, stats_service.calculate_percentile
+  flask     - app.py routes through the Flask test client, one client per thread
+  gunicorn  - app.py under a local gunicorn with --workers N, over HTTP
+
+Usage (from backend/):
+    python benchmarks/load_test.py --target flask --rows 100000 --requests 20000 --concurrency 8
+    python benchmarks/load_test.py --target gunicorn --workers 4 --save-baseline gunicorn-4w
+    python benchmarks/load_test.py --target flask --compare flask-default --tolerance 0.25
+
+--compare exits with status 1 when an operation's throughput drops, or its
+p99 rises, by more than --tolerance against the stored baseline, and with
+status 2 when the workload settings differ from the baseline's.
+
+Pre-deploy check against the committed reference (benchmarks/baselines/):
+    python benchmarks/load_test.py --target flask --repeat 5 --compare flask-default --tolerance 0.3 --min-delta-ms 25
+
+flask-default.json was recorded with the default settings on a 1-cpu Linux
+box, where runs vary by up to ~25% in throughput and ~15ms in p99, hence the
+looser tolerance above. Baselines are machine-specific: on other hardware,
+record your own with --repeat 5 --save-baseline on the machine that runs the
+comparison (and commit it), then compare against that.
+"""
+import argparse
+import atexit
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+sys.path.insert(0, BACKEND_DIR)
+
+from services.stats_service import STATS_DATA
+
+GAME_TYPES = list(STATS_DATA.keys())
+
+
+# --- workload -------------------------------------------------------------
+
+def make_ops(n, users, read_ratio, seed=7):
+    """
+    A reproducible list of (name, method, path, body) requests.
+    """
+    rng = random.Random(seed)
+    ops = []
+    for _ in range(n):
+        game_type = rng.choice(GAME_TYPES)
+        data = STATS_DATA[game_type]
+        user_id = f"user_{rng.randrange(users)}"
+        if rng.random() >= read_ratio:
+            score = round(max(0.0, rng.gauss(data['mean'], data['std_dev'])), 2)
+            ops.append(('submit', 'POST', '/api/cognitive/analyze',
+                        {"game_type": game_type, "score": score, "username": user_id}))
+            continue
+        kind = rng.random()
+        if kind < 0.6:
+            ops.append(('leaderboard', 'GET', f'/api/leaderboard?game_type={game_type}', None))
+        elif kind < 0.8:
+            ops.append(('rank', 'GET', f'/api/rank?game_type={game_type}&user_id={user_id}', None))
+        elif kind < 0.95:
+            items = [{"game_type": rng.choice(GAME_TYPES), "score": rng.random() * 100} for _ in range(20)]
+            ops.append(('percentile_batch', 'POST', '/api/percentile/batch', {"items": items}))
+        else:
+            ops.append(('trends', 'GET', f'/api/trends?game_type={game_type}', None))
+    return ops
+
+
+def run_ops(ops, concurrency, make_sender):
+    """
+    Runs ops across concurrency threads; returns ({name: [latency seconds]}, {name: errors}, elapsed).
+    make_sender() is called once per thread and returns send(method, path, body) -> status.
+    """
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def worker(chunk):
+        send = make_sender()
+        local_lat = {}
+        local_err = {}
+        for name, method, path, body in chunk:
+            start = time.perf_counter()
+            try:
+                status = send(method, path, body)
+            except Exception:
+                status = 599
+            local_lat.setdefault(name, []).append(time.perf_counter() - start)
+            # 404 from /api/rank just means the user has no score for that game yet
+            if status >= 500 or (status >= 400 and status != 404):
+                local_err[name] = local_err.get(name, 0) + 1
+        with lock:
+            for name, values in local_lat.items():
+                latencies.setdefault(name, []).extend(values)
+            for name, count in local_err.items():
+                errors[name] = errors.get(name, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(ops[i::concurrency],)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, elapsed):
+    def pct(values, q):
+        return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 3)
+
+    results = {}
+    everything = []
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        everything.extend(values)
+        results[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "throughput": round(len(values) / elapsed, 1),
+            "p50_ms": pct(values, 0.50),
+            "p95_ms": pct(values, 0.95),
+            "p99_ms": pct(values, 0.99),
+        }
+    everything.sort()
+    if everything:
+        results["all"] = {
+            "count": len(everything),
+            "errors": sum(errors.values()),
+            "throughput": round(len(everything) / elapsed, 1),
+            "p50_ms": pct(everything, 0.50),
+            "p95_ms": pct(everything, 0.95),
+            "p99_ms": pct(everything, 0.99),
+        }
+    return results
+
+
+def merge_runs(runs):
+    """
+    Median of each latency/throughput figure across repeated runs; counts are summed.
+    """
+    merged = {}
+    for name in runs[0]:
+        values = [run[name] for run in runs if name in run]
+        merged[name] = {
+            key: (sum(v[key] for v in values) if key in ('count', 'errors')
+                  else sorted(v[key] for v in values)[len(values) // 2])
+            for key in values[0]
+        }
+    return merged
+
+
+def db_size(path):
+    """
+    (main file bytes, WAL bytes); the WAL holds pages not yet checkpointed.
+    """
+    return tuple(os.path.getsize(p) if os.path.exists(p) else 0 for p in (path, path + '-wal'))
+
+
+# --- targets --------------------------------------------------------------
+
+def bench_functions(args, ops):
+    from services import db_service
+    from services.stats_service import calculate_percentile
+
+    def make_sender():
+        def send(method, path, body):
+            if body and 'game_type' in body and 'items' not in body:
+                ok = db_service.save_game_result(body['username'], body['game_type'], body['score'])
+                return 200 if ok is not None else 500
+            if path.startswith('/api/leaderboard'):
+                db_service.get_leaderboard(path.split('=', 1)[1])
+            elif body and 'items' in body:
+                for item in body['items']:
+                    calculate_percentile(item['game_type'], item['score'])
+            return 200
+        return send
+
+    # Only the three hot paths named above
+    ops = [op for op in ops if op[0] in ('submit', 'leaderboard', 'percentile_batch')]
+    renamed = {'submit': 'save_game_result', 'leaderboard': 'get_leaderboard',
+               'percentile_batch': 'calculate_percentile_x20'}
+    ops = [(renamed[name], method, path, body) for name, method, path, body in ops]
+    return run_ops(ops, args.concurrency, make_sender)
+
+
+def wait_for_ingest_drain(stats_fn, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if stats_fn().get('depth', 0) == 0:
+            return
+        time.sleep(0.05)
+
+
+def bench_flask(args, ops):
+    from app import app
+    from services.ingest_service import get_ingest_stats
+
+    def make_sender():
+        client = app.test_client()
+
+        def send(method, path, body):
+            if method == 'GET':
+                return client.get(path).status_code
+            return client.post(path, json=body).status_code
+        return send
+
+    result = run_ops(ops, args.concurrency, make_sender)
+    wait_for_ingest_drain(get_ingest_stats)
+    return result
+
+
+def reset_process_state():
+    """
+    Drops what an in-process run leaves warm (ingest writer, pooled connection,
+    leaderboard cache, rank index, sketches) so every repeat starts like the first.
+    """
+    from services import db_service, ingest_service, leaderboard_cache, quantile_sketch
+
+    if ingest_service._queue is not None:
+        ingest_service._queue.stop()
+        ingest_service._queue = None
+    db_service.close_db_connection()
+    with leaderboard_cache._lock:
+        leaderboard_cache._entries.clear()
+    with quantile_sketch._lock:
+        quantile_sketch._state.clear()
+        quantile_sketch._scanned_through = 0
+
+
+def restore_db(seed_path, db_path):
+    """
+    Replaces the benchmark database with a fresh copy of the seeded one.
+    """
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.copy(seed_path, db_path)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def bench_gunicorn(args, ops):
+    port = _free_port()
+    cmd = [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+           '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app']
+    server = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=os.environ.copy())
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+                conn.request('GET', '/api/health')
+                if conn.getresponse().status == 200:
+                    break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.2)
+
+        def make_sender():
+            def send(method, path, body):
+                # Sync workers close the connection after each response
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                payload = json.dumps(body) if body is not None else None
+                headers = {'Content-Type': 'application/json'} if body is not None else {}
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                conn.close()
+                return response.status
+            return send
+
+        return run_ops(ops, args.concurrency, make_sender)
+    finally:
+        # SIGTERM lets each worker drain its ingest queue before exiting
+        server.terminate()
+        server.wait(timeout=60)
+
+
+TARGETS = {'functions': bench_functions, 'flask': bench_flask, 'gunicorn': bench_gunicorn}
+
+
+# --- baselines ------------------------------------------------------------
+
+WORKLOAD_KEYS = ('target', 'rows', 'users', 'requests', 'concurrency', 'read_ratio', 'workers', 'threads')
+
+
+def compare(report, baseline, tolerance, min_delta_ms):
+    """
+    Returns a list of regression messages (empty if none). Latency changes
+    smaller than min_delta_ms are ignored as scheduler noise.
+    """
+    problems = []
+    for name, base in baseline["results"].items():
+        current = report["results"].get(name)
+        if current is None:
+            continue
+        if current["throughput"] < base["throughput"] * (1 - tolerance):
+            problems.append(f"{name}: throughput {current['throughput']} < baseline {base['throughput']}")
+        if (current["p99_ms"] > base["p99_ms"] * (1 + tolerance)
+                and current["p99_ms"] - base["p99_ms"] > min_delta_ms):
+            problems.append(f"{name}: p99 {current['p99_ms']}ms > baseline {base['p99_ms']}ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=sorted(TARGETS), default='flask')
+    parser.add_argument('--rows', type=int, default=10000, help='plays to seed before the run (10k..10M)')
+    parser.add_argument('--users', type=int, help='synthetic players (default rows / 20)')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='run the workload N times and report medians (use 5+ for baselines)')
+    parser.add_argument('--read-ratio', type=float, default=0.8)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker')
+    parser.add_argument('--db', help='reuse a seeded database (copied, never modified)')
+    parser.add_argument('--output', help='also write the JSON report here')
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help='ignore p99 increases smaller than this')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='brain-bench-')
+    try:
+        db_path = os.path.join(tmp, 'brain.db')
+        # Must be set before db_service (via seed, app, ...) is first imported
+        os.environ['BRAIN_DB_PATH'] = db_path
+        os.environ['BRAIN_INGEST_SPOOL_DIR'] = os.path.join(tmp, 'spool')
+        from benchmarks.seed import seed_db
+
+        # Every repeat runs against its own copy of this one
+        seed_path = os.path.join(tmp, 'seed.db')
+        if args.db:
+            shutil.copy(args.db, seed_path)
+            seed_seconds = 0.0
+        else:
+            seed_seconds = seed_db(seed_path, args.rows, args.users)
+        users = args.users or max(100, args.rows // 20)
+        ops = make_ops(args.requests, users, args.read_ratio)
+        in_process = args.target in ('functions', 'flask')
+        runs = []
+        elapsed = 0.0
+        for _ in range(args.repeat):
+            if in_process:
+                reset_process_state()
+            restore_db(seed_path, db_path)
+            if in_process:
+                from services import db_service, stats_service
+                db_service.warm_rank_index()
+                if stats_service.PERCENTILE_MODE == 'empirical':
+                    # load_sketches() registers its exit hook again on every call
+                    atexit.unregister(db_service.persist_sketches)
+                    db_service.load_sketches()
+            size_before = db_size(db_path)
+            latencies, errors, run_elapsed = TARGETS[args.target](args, ops)
+            runs.append(summarize(latencies, errors, run_elapsed))
+            elapsed += run_elapsed
+        if in_process:
+            # Stop the in-process writer before its spool directory is removed
+            reset_process_state()
+        size_after = db_size(db_path)
+
+        report = {
+            "meta": {
+                "target": args.target,
+                "rows": args.rows,
+                "users": users,
+                "requests": args.requests,
+                "repeat": args.repeat,
+                "concurrency": args.concurrency,
+                "read_ratio": args.read_ratio,
+                "workers": args.workers if args.target == 'gunicorn' else None,
+                "threads": args.threads if args.target == 'gunicorn' else None,
+                "seed_seconds": round(seed_seconds, 2),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "machine": f"{platform.system()} {platform.machine()} / {os.cpu_count()} cpus",
+                "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            },
+            "elapsed_seconds": round(elapsed, 3),
+            "results": merge_runs(runs),
+            "db": {
+                "size_before": size_before[0],
+                "size_after": size_after[0],
+                "growth_bytes": size_after[0] - size_before[0],
+                "wal_bytes_after": size_after[1],
+            },
+        }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f'{args.save_baseline}.json'), 'w') as f:
+            f.write(text + '\n')
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'{args.compare}.json')) as f:
+            baseline = json.load(f)
+        # Numbers are only comparable for the same workload
+        mismatched = [key for key in WORKLOAD_KEYS if baseline["meta"].get(key) != report["meta"][key]]
+        if mismatched:
+            print(f"baseline {args.compare} was recorded with different {', '.join(mismatched)}; "
+                  f"rerun with the baseline's settings", file=sys.stderr)
+            sys.exit(2)
+        if baseline["meta"].get("machine") != report["meta"]["machine"]:
+            print(f"note: baseline was recorded on {baseline['meta'].get('machine')}", file=sys.stderr)
+        problems = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Seeds a brain.db with synthetic players and plays across every game in STATS_DATA.
+
+Rows go straight into game_logs in large transactions, then user_stats and
+the rollups are derived from them in SQL, so 10M rows stay practical.
+
+Usage (from backend/):
+    python benchmarks/seed.py /tmp/bench.db --rows 1000000 [--users 50000] [--days 90]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import init_db
+from services.db_service import determine_tier
+from services.rollup_service import histogram_bin, rebuild_rollups
+from services.stats_service import STATS_DATA
+
+GAME_TYPES = list(STATS_DATA.keys())
+CHUNK_ROWS = 200000
+
+
+def _chunks(rows, users, days, seed):
+    rng = np.random.default_rng(seed)
+    means = np.array([STATS_DATA[g]['mean'] for g in GAME_TYPES], dtype=float)
+    std_devs = np.array([STATS_DATA[g]['std_dev'] for g in GAME_TYPES], dtype=float)
+    now = time.time()
+
+    for start in range(0, rows, CHUNK_ROWS):
+        n = min(CHUNK_ROWS, rows - start)
+        games = rng.integers(0, len(GAME_TYPES), n)
+        # Right-skewed like real reaction/completion times, never negative
+        z = rng.standard_normal(n) + 0.3 * rng.exponential(1.0, n)
+        scores = np.round(np.maximum(0, means[games] + std_devs[games] * z), 2)
+        user_ids = rng.integers(0, users, n)
+        played_at = now - rng.random(n) * days * 86400
+        stamps = [time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(t)) for t in played_at]
+        yield [(f"user_{u}", GAME_TYPES[g], float(s), ts)
+               for u, g, s, ts in zip(user_ids.tolist(), games.tolist(), scores.tolist(), stamps)]
+
+
+def seed_db(path, rows, users=None, days=90, seed=42):
+    """
+    Creates (or extends) the database at path with rows synthetic plays.
+    Returns elapsed seconds.
+    """
+    users = users or max(100, rows // 20)
+    init_db.DB_NAME = path
+    with redirect_stdout(StringIO()):
+        init_db.init_db()
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.create_function('determine_tier', 2, determine_tier, deterministic=True)
+    conn.create_function('histogram_bin', 2, histogram_bin, deterministic=True)
+
+    for chunk in _chunks(rows, users, days, seed):
+        conn.executemany('INSERT INTO game_logs (user_id, game_type, score, created_at) VALUES (?, ?, ?, ?)',
+                         chunk)
+        conn.commit()
+
+    lower = [g for g in GAME_TYPES if STATS_DATA[g].get('lower_is_better')]
+    placeholders = ','.join('?' * len(lower))
+    conn.execute(f'''
+        INSERT OR REPLACE INTO user_stats (user_id, game_type, best_score, total_plays, tier, last_played_at)
+        SELECT user_id, game_type, best, plays, determine_tier(game_type, best), last_played
+        FROM (
+            SELECT user_id, game_type,
+                   CASE WHEN game_type IN ({placeholders}) THEN MIN(score) ELSE MAX(score) END AS best,
+                   COUNT(*) AS plays, MAX(created_at) AS last_played
+            FROM game_logs
+            GROUP BY user_id, game_type
+        )
+    ''', lower)
+    rebuild_rollups(conn)
+    conn.commit()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    elapsed = seed_db(args.path, args.rows, args.users, args.days, args.seed)
+    size = os.path.getsize(args.path)
+    print(f"Seeded {args.rows} plays into {args.path} in {elapsed:.1f}s ({size / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
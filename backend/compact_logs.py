@@ -0,0 +1,9 @@
+import sys
+from services.db_service import compact_game_logs, LOG_RETENTION_DAYS
+
+# Run periodically (e.g. daily cron): python compact_logs.py [retention_days]
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else LOG_RETENTION_DAYS
+    print(f"Compacting game_logs older than {days} days")
+    deleted = compact_game_logs(days)
+    print(f"- Deleted {deleted} raw rows (kept in rollups)")
@@ -1,17 +1,24 @@
 
 import sqlite3
 import os
+from services.rollup_service import histogram_bin, rebuild_rollups
 
-DB_NAME = 'brain.db'
+DB_NAME = os.environ.get('BRAIN_DB_PATH', 'brain.db')
 
 def init_db():
     # Remove existing db if needed? No, IF NOT EXISTS handles it.
     
     conn = sqlite3.connect(DB_NAME)
+    conn.row_factory = sqlite3.Row
+    conn.create_function('histogram_bin', 2, histogram_bin, deterministic=True)
     c = conn.cursor()
 
     print(f"Initializing database: {DB_NAME}")
 
+    # Lets log compaction return freed pages to the OS.
+    # Only takes effect on a new file (existing ones need a one-off VACUUM).
+    c.execute('PRAGMA auto_vacuum=INCREMENTAL')
+
     # 1. Game Logs Table
     # Stores every single game played
     c.execute('''
@@ -40,9 +47,70 @@ def init_db():
     ''')
     print("- Verified table: user_stats")
 
-    # 3. Create Indexes for Performance
+    # 3. Percentile Sketches Table
+    # Serialized streaming quantile sketch per game (empirical percentile mode)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS percentile_sketches (
+            game_type TEXT PRIMARY KEY,
+            sketch TEXT,
+            sample_count INTEGER DEFAULT 0,
+            last_log_id INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    print("- Verified table: percentile_sketches")
+
+    # 4. Ingest Spool Table
+    # How far each local spool file has been written to the DB (async score ingestion)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_spool (
+            spool TEXT PRIMARY KEY,
+            committed_offset INTEGER DEFAULT 0
+        )
+    ''')
+    print("- Verified table: ingest_spool")
+
+    # 5. Rollup Tables
+    # Daily/weekly aggregates per game, maintained on every insert into game_logs
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS score_rollups (
+            period TEXT,
+            bucket TEXT,
+            game_type TEXT,
+            plays INTEGER DEFAULT 0,
+            min_score REAL,
+            max_score REAL,
+            sum_score REAL DEFAULT 0,
+            PRIMARY KEY (period, bucket, game_type)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS score_rollup_bins (
+            period TEXT,
+            bucket TEXT,
+            game_type TEXT,
+            bin INTEGER,
+            plays INTEGER DEFAULT 0,
+            PRIMARY KEY (period, bucket, game_type, bin)
+        ) WITHOUT ROWID
+    ''')
+    print("- Verified tables: score_rollups, score_rollup_bins")
+
+    # Backfill once from logs written before rollups existed
+    has_rollups = c.execute('SELECT 1 FROM score_rollups LIMIT 1').fetchone()
+    has_logs = c.execute('SELECT 1 FROM game_logs LIMIT 1').fetchone()
+    if has_logs and not has_rollups:
+        rebuild_rollups(conn)
+        print("- Backfilled rollups from game_logs")
+
+    # 6. Create Indexes for Performance
     c.execute('CREATE INDEX IF NOT EXISTS idx_logs_game_score ON game_logs(game_type, score)')
+    # Time-bucketed access: compaction by age, per-user history
+    c.execute('CREATE INDEX IF NOT EXISTS idx_logs_created ON game_logs(created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_logs_user_game_created ON game_logs(user_id, game_type, created_at)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_stats_game_best ON user_stats(game_type, best_score DESC)')
+    # Incremental rank index refresh (rows changed since a watermark)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_stats_last_played ON user_stats(last_played_at)')
     print("- Created indexes")
 
     conn.commit()
@@ -1,24 +1,140 @@
-
+import atexit
 import sqlite3
 import os
+import threading
+import time
 from services.stats_service import STATS_DATA
+from services import rank_index, quantile_sketch, stats_service, leaderboard_cache, rollup_service, instrumentation
 
 # Use absolute path for DB to avoid confusion
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DB_PATH = os.path.join(BASE_DIR, 'brain.db')
+DB_PATH = os.environ.get('BRAIN_DB_PATH', os.path.join(BASE_DIR, 'brain.db'))
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+# Connection tuning (one long-lived connection per thread / gunicorn worker)
+BUSY_TIMEOUT_MS = int(os.environ.get('BRAIN_DB_BUSY_TIMEOUT_MS', 5000))
+MMAP_SIZE = int(os.environ.get('BRAIN_DB_MMAP_SIZE', 64 * 1024 * 1024))
+STATEMENT_CACHE_SIZE = 128
+LOCK_RETRIES = 5
+LOCK_RETRY_DELAY = 0.01  # seconds, doubled on each retry
+
+# Group commit: queue submissions and flush them in one transaction every
+# GROUP_COMMIT_MS milliseconds or GROUP_COMMIT_ROWS rows (0 = disabled)
+GROUP_COMMIT_MS = int(os.environ.get('BRAIN_GROUP_COMMIT_MS', 0))
+GROUP_COMMIT_ROWS = int(os.environ.get('BRAIN_GROUP_COMMIT_ROWS', 256))
+
+# Raw game_logs rows older than this are folded away by compact_game_logs()
+LOG_RETENTION_DAYS = int(os.environ.get('BRAIN_LOG_RETENTION_DAYS', 90))
+
+# Empirical percentile sketches are written back to SQLite at most this often
+SKETCH_PERSIST_SECONDS = int(os.environ.get('BRAIN_SKETCH_PERSIST_SECONDS', 60))
+
+# The in-memory rank index picks up other workers' saves from user_stats this often
+RANK_REFRESH_SECONDS = float(os.environ.get('BRAIN_RANK_REFRESH_SECONDS', 5))
+RANK_REFRESH_OVERLAP_SECONDS = 30
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_pool_stats = {
+    'connections_opened': 0,
+    'pool_hits': 0,
+    'lock_waits': 0,
+    'lock_retries': 0,
+    'lock_failures': 0,
+}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _pool_stats[key] += amount
+
+
+def _open_connection():
+    # check_same_thread stays on: each thread owns its own connection.
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000.0,
+                           cached_statements=STATEMENT_CACHE_SIZE,
+                           factory=instrumentation.connection_factory())
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    # Lets the UPSERT compute tiers in SQL with the same rules as Python
+    conn.create_function('determine_tier', 2, determine_tier, deterministic=True)
+    conn.create_function('histogram_bin', 2, rollup_service.histogram_bin, deterministic=True)
+    _bump('connections_opened')
+    return conn
+
+
+@instrumentation.timed('get_db_connection')
+def get_db_connection():
+    """
+    Returns this thread's persistent connection, opening it on first use.
+    Callers must not close it; use close_db_connection() on shutdown.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        # New thread, or a forked gunicorn worker inheriting the parent's handle
+        conn = _open_connection()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    else:
+        _bump('pool_hits')
     return conn
 
+
+def close_db_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def _is_locked_error(e):
+    msg = str(e).lower()
+    return 'locked' in msg or 'busy' in msg
+
+
+def run_with_retry(fn):
+    """
+    Runs fn(conn) on this thread's connection, retrying with backoff when
+    SQLite reports the database as locked beyond busy_timeout.
+    """
+    conn = get_db_connection()
+    delay = LOCK_RETRY_DELAY
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return fn(conn)
+        except Exception as e:
+            # The connection outlives this call, so never leave a transaction open
+            if conn.in_transaction:
+                conn.rollback()
+            if not (isinstance(e, sqlite3.OperationalError) and _is_locked_error(e)):
+                raise
+            if attempt == 0:
+                _bump('lock_waits')
+            if attempt == LOCK_RETRIES:
+                _bump('lock_failures')
+                raise
+            _bump('lock_retries')
+            with instrumentation.span('db_lock_wait'):
+                time.sleep(delay)
+            delay *= 2
+
+
+def get_db_stats():
+    """
+    Health/metrics hook: connection reuse and lock contention counters.
+    """
+    with _stats_lock:
+        stats = dict(_pool_stats)
+    stats['db_path'] = DB_PATH
+    return stats
+
 def get_leaderboard(game_type, limit=10):
     """
     Retrieves the top players for a specific game type.
+    Returns None when the query fails, so callers can tell that from an empty board.
     """
-    conn = get_db_connection()
-    c = conn.cursor()
-    
     # Determine sorting order
     lower_is_better = False
     if game_type in STATS_DATA:
@@ -26,79 +142,428 @@ def get_leaderboard(game_type, limit=10):
         
     order = "ASC" if lower_is_better else "DESC"
     
-    try:
-        c.execute(f'''
+    def query(conn):
+        c = conn.execute(f'''
             SELECT user_id, best_score, tier, total_plays 
             FROM user_stats 
             WHERE game_type = ? 
             ORDER BY best_score {order} 
             LIMIT ?
         ''', (game_type, limit))
-        
-        rows = c.fetchall()
-        return [dict(row) for row in rows]
+        return [dict(row) for row in c.fetchall()]
+
+    try:
+        return run_with_retry(query)
     except Exception as e:
         print(f"Leaderboard Error: {e}")
-        return []
-    finally:
-        conn.close()
+        return None
+
+
+# Single-statement stats update: best_score, total_plays and tier are all
+# computed by SQLite against the existing row (SET expressions see old values).
+UPSERT_STATS_SQL = '''
+    INSERT INTO user_stats (user_id, game_type, best_score, total_plays, tier)
+    VALUES (:user_id, :game_type, :score, 1, determine_tier(:game_type, :score))
+    ON CONFLICT(user_id, game_type) DO UPDATE SET
+        best_score = CASE WHEN :lower_is_better
+                          THEN MIN(best_score, excluded.best_score)
+                          ELSE MAX(best_score, excluded.best_score) END,
+        total_plays = total_plays + 1,
+        tier = determine_tier(excluded.game_type,
+                              CASE WHEN :lower_is_better
+                                   THEN MIN(best_score, excluded.best_score)
+                                   ELSE MAX(best_score, excluded.best_score) END),
+        last_played_at = CURRENT_TIMESTAMP
+    RETURNING best_score, total_plays, tier
+'''
+
+
+def _write_result(conn, params):
+    """
+    Runs the log insert, rollup update and stats upsert for one submission (no commit).
+    """
+    c = conn.execute('INSERT INTO game_logs (user_id, game_type, score) VALUES (:user_id, :game_type, :score)',
+                     params)
+    rollup_service.record_play(conn, {"log_id": c.lastrowid})
+    row = conn.execute(UPSERT_STATS_SQL, params).fetchone()
+    return {"new_best": row['best_score'], "tier": row['tier'], "plays": row['total_plays']}
+
+
+def _commit_one(conn, params):
+    result = _write_result(conn, params)
+    conn.commit()
+    return result
+
 
+def make_result_params(user_id, game_type, score, lower_is_better=None):
+    if lower_is_better is None:
+        lower_is_better = STATS_DATA.get(game_type, {}).get('lower_is_better', False)
+    return {"user_id": user_id, "game_type": game_type, "score": score,
+            "lower_is_better": 1 if lower_is_better else 0}
 
-def save_game_result(user_id, game_type, score, lower_is_better=False):
+
+def save_game_result(user_id, game_type, score, lower_is_better=None):
     """
     Saves the game result to DB and updates user stats.
+    lower_is_better defaults to the game's setting in STATS_DATA.
     """
-    conn = get_db_connection()
-    c = conn.cursor()
-    
+    params = make_result_params(user_id, game_type, score, lower_is_better)
+
+    if GROUP_COMMIT_MS > 0:
+        return _get_group_writer().submit(params)
+
     try:
-        # 1. Insert into game_logs
-        c.execute('INSERT INTO game_logs (user_id, game_type, score) VALUES (?, ?, ?)',
-                  (user_id, game_type, score))
-        
-        # 2. Check existing stats
-        c.execute('SELECT best_score, total_plays FROM user_stats WHERE user_id = ? AND game_type = ?',
-                  (user_id, game_type))
-        row = c.fetchone()
-        
-        new_best = score
-        total_plays = 1
-        
-        if row:
-            current_best = row['best_score']
-            total_plays = row['total_plays'] + 1
-            
-            if lower_is_better:
-                new_best = min(score, current_best)
-            else:
-                new_best = max(score, current_best)
-            
-            # Update
-            # Tier logic is handled separately or passed in
-            tier = determine_tier(game_type, new_best)
-            
-            c.execute('''
-                UPDATE user_stats 
-                SET best_score = ?, total_plays = ?, tier = ?, last_played_at = CURRENT_TIMESTAMP
-                WHERE user_id = ? AND game_type = ?
-            ''', (new_best, total_plays, tier, user_id, game_type))
-        else:
-            # Insert
-            tier = determine_tier(game_type, score)
-            c.execute('''
-                INSERT INTO user_stats (user_id, game_type, best_score, total_plays, tier)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, game_type, score, 1, tier))
-            
-        conn.commit()
-        return {"new_best": new_best, "tier": tier, "plays": total_plays}
-        
+        result = run_with_retry(lambda conn: _commit_one(conn, params))
     except Exception as e:
         print(f"DB Error: {e}")
         return None
+    _after_commit(params, result)
+    _after_batch()
+    return result
+
+
+def _after_commit(params, result):
+    # Keep in-memory indexes in step with what is now durable
+    result["rank"] = rank_index.record_result(params["game_type"], params["user_id"],
+                                              result["new_best"], result["tier"], result["plays"])
+    # Only a player inside the top-N can change the cached leaderboard
+    if result["rank"] <= leaderboard_cache.LEADERBOARD_LIMIT:
+        leaderboard_cache.invalidate(params["game_type"])
+
+
+def _after_batch():
+    # Once per committed transaction, not per row
+    if stats_service.PERCENTILE_MODE == 'empirical':
+        sync_sketches()
+
+
+_sketch_lock = threading.Lock()
+_last_sketch_persist = time.monotonic()
+
+
+def refresh_sketches(conn):
+    """
+    Feeds game_logs rows newer than the sketches' watermark into them.
+    Reading from the log (not just our own saves) also picks up other workers' plays.
+    """
+    rows = conn.execute('SELECT id, game_type, score FROM game_logs WHERE id > ? ORDER BY id',
+                        (quantile_sketch.last_log_id(),))
+    return quantile_sketch.apply_logs(rows)
+
+
+def persist_sketches():
+    """
+    Writes changed sketches to percentile_sketches, never replacing a row
+    that has seen more of the log than ours.
+    """
+    rows = quantile_sketch.snapshot()
+    if not rows:
+        return 0
+
+    def write(conn):
+        conn.executemany('''
+            INSERT INTO percentile_sketches (game_type, sketch, sample_count, last_log_id, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(game_type) DO UPDATE SET
+                sketch = excluded.sketch,
+                sample_count = excluded.sample_count,
+                last_log_id = excluded.last_log_id,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE excluded.last_log_id >= percentile_sketches.last_log_id
+        ''', rows)
+        conn.commit()
+        return len(rows)
+
+    try:
+        return run_with_retry(write)
+    except Exception as e:
+        print(f"Sketch Persist Error: {e}")
+        return 0
+
+
+def sync_sketches():
+    """
+    Catches sketches up with game_logs and persists them every SKETCH_PERSIST_SECONDS.
+    Skipped if another thread is already syncing; it will pick up our rows.
+    """
+    global _last_sketch_persist
+    if not _sketch_lock.acquire(blocking=False):
+        return
+    try:
+        run_with_retry(refresh_sketches)
+        if time.monotonic() - _last_sketch_persist >= SKETCH_PERSIST_SECONDS:
+            _last_sketch_persist = time.monotonic()
+            persist_sketches()
+    except Exception as e:
+        print(f"Sketch Sync Error: {e}")
     finally:
-        conn.close()
+        _sketch_lock.release()
+
+
+def load_sketches():
+    """
+    Restores persisted sketches, then reads only the log rows written since.
+    Returns the number of log rows applied during catch-up.
+    """
+    def load(conn):
+        rows = conn.execute('SELECT game_type, sketch, last_log_id FROM percentile_sketches')
+        quantile_sketch.load(tuple(row) for row in rows)
+        return refresh_sketches(conn)
+
+    try:
+        applied = run_with_retry(load)
+    except Exception as e:
+        print(f"Sketch Load Error: {e}")
+        return 0
+    atexit.register(persist_sketches)
+    return applied
+
+
+def get_score_trend(game_type, period='day', start=None, end=None):
+    """
+    Daily or weekly plays/min/max/mean/histogram for a game, from the rollup tables.
+    """
+    try:
+        return run_with_retry(lambda conn: rollup_service.get_score_trend(conn, game_type, period, start, end))
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Trend Error: {e}")
+        return []
+
+
+def get_user_history(user_id, game_type, limit=50):
+    try:
+        return run_with_retry(lambda conn: rollup_service.get_user_history(conn, user_id, game_type, limit))
+    except Exception as e:
+        print(f"History Error: {e}")
+        return []
+
+
+def compact_game_logs(retention_days=None):
+    """
+    Deletes raw game_logs rows past the retention window (rollups keep their totals).
+    Rows the persisted percentile sketches have not read yet are kept.
+    """
+    if retention_days is None:
+        retention_days = LOG_RETENTION_DAYS
+
+    def compact(conn):
+        max_log_id = None
+        if stats_service.PERCENTILE_MODE == 'empirical':
+            # Go by what is persisted, not this process's sketches: the cron
+            # runs in a fresh process whose sketches only know the raw rows left
+            max_log_id = conn.execute(
+                'SELECT COALESCE(MIN(last_log_id), 0) FROM percentile_sketches').fetchone()[0]
+        return rollup_service.compact_game_logs(conn, retention_days, max_log_id)
+
+    return run_with_retry(compact)
+
+
+_rank_watermark = None  # newest user_stats.last_played_at read into the rank index
+_rank_refreshed_at = 0.0
+_rank_refresh_lock = threading.Lock()
+
+
+def _max_last_played(conn):
+    return conn.execute('SELECT MAX(last_played_at) FROM user_stats').fetchone()[0]
+
+
+def warm_rank_index():
+    """
+    Loads every user_stats row into the in-memory rank index.
+    """
+    global _rank_watermark, _rank_refreshed_at
+
+    def load(conn):
+        watermark = _max_last_played(conn)
+        rows = conn.execute('SELECT user_id, game_type, best_score, tier, total_plays FROM user_stats')
+        return rank_index.load_user_stats(rows), watermark
+
+    try:
+        count, _rank_watermark = run_with_retry(load)
+    except Exception as e:
+        print(f"Rank Index Error: {e}")
+        return 0
+    _rank_refreshed_at = time.monotonic()
+    return count
+
+
+def refresh_rank_index(force=False):
+    """
+    Applies user_stats rows changed since the last refresh, including saves
+    made by other workers; at most once per RANK_REFRESH_SECONDS unless forced.
+    Rows are re-read RANK_REFRESH_OVERLAP_SECONDS behind the watermark because
+    last_played_at is set before the row commits; the rank index ignores
+    rows it already has (by total_plays). Returns the number of rows read.
+    """
+    global _rank_watermark, _rank_refreshed_at
+    if not force and time.monotonic() - _rank_refreshed_at < RANK_REFRESH_SECONDS:
+        return 0
+    if not _rank_refresh_lock.acquire(blocking=False):
+        return 0  # another thread is refreshing
+    try:
+        _rank_refreshed_at = time.monotonic()
+        if _rank_watermark is None:
+            return warm_rank_index()
+
+        def load(conn):
+            watermark = _max_last_played(conn)
+            rows = conn.execute('''
+                SELECT user_id, game_type, best_score, tier, total_plays
+                FROM user_stats
+                WHERE last_played_at >= datetime(?, ?)
+            ''', (_rank_watermark, f'-{RANK_REFRESH_OVERLAP_SECONDS} seconds')).fetchall()
+            return rows, watermark
+
+        try:
+            rows, watermark = run_with_retry(load)
+        except Exception as e:
+            print(f"Rank Index Error: {e}")
+            return 0
+        for row in rows:
+            rank_index.record_result(row['game_type'], row['user_id'], row['best_score'],
+                                     row['tier'], row['total_plays'])
+        _rank_watermark = watermark or _rank_watermark
+        return len(rows)
+    finally:
+        _rank_refresh_lock.release()
+
+
+class GroupCommitWriter:
+    """
+    Batches concurrent submissions into one transaction (one fsync) per
+    flush. Callers still block until their row is committed, so
+    save_game_result keeps its return value and durability guarantees.
+    """
+
+    def __init__(self, interval_ms, max_rows):
+        self.interval = interval_ms / 1000.0
+        self.max_rows = max_rows
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, params):
+        item = {"params": params, "done": threading.Event(), "result": None}
+        with self._cond:
+            self._pending.append(item)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_rows:
+                self._cond.notify()
+        item["done"].wait()
+        return item["result"]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Collect more rows for up to one interval
+                if len(self._pending) < self.max_rows:
+                    self._cond.wait(self.interval)
+                batch = self._pending[:self.max_rows]
+                del self._pending[:self.max_rows]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            results = write_batch([item["params"] for item in batch])
+        except Exception as e:
+            print(f"DB Error (group commit of {len(batch)} rows): {e}")
+            results = []
+
+        # Rows past the end of a partial result were never committed
+        for i, item in enumerate(batch):
+            item["result"] = results[i] if i < len(results) else None
+            item["done"].set()
+
+
+# Errors that mean this row can never be written; anything else (locked,
+# disk full, I/O error, missing table, ...) may pass and the row is retried
+BAD_ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.DataError, TypeError, ValueError)
+
+
+def write_batch(params_list, in_transaction=None, on_failure=None):
+    """
+    Commits many submissions in one transaction and returns their results.
+    in_transaction(conn, count), if given, runs inside every transaction
+    that commits rows, with count = how many leading rows of params_list
+    are durable once it commits.
+    If a row is bad (BAD_ROW_ERRORS), rows are retried one transaction each;
+    a row that fails on its own that way is handed to on_failure(params, error)
+    and skipped (result None). Any other error stops there: the results so far
+    are returned (shorter than params_list) and the rest is left to the
+    caller; an error before anything was written is raised.
+    """
+    def write(conn):
+        results = [_write_result(conn, params) for params in params_list]
+        if in_transaction is not None:
+            in_transaction(conn, len(params_list))
+        conn.commit()
+        return results
+
+    try:
+        results = run_with_retry(write)
+    except BAD_ROW_ERRORS as e:
+        print(f"DB Error (batch of {len(params_list)} rows): {e}")
+        # Isolate the bad row(s): commit the rest individually
+        results = _write_singly(params_list, in_transaction, on_failure)
+
+    for params, result in zip(params_list, results):
+        if result is not None:
+            _after_commit(params, result)
+    _after_batch()
+    return results
+
+
+def _write_singly(params_list, in_transaction, on_failure):
+    results = []
+    for i, params in enumerate(params_list):
+        def write_one(conn):
+            result = _write_result(conn, params)
+            if in_transaction is not None:
+                in_transaction(conn, i + 1)
+            conn.commit()
+            return result
+
+        try:
+            results.append(run_with_retry(write_one))
+            continue
+        except BAD_ROW_ERRORS as e:
+            print(f"DB Error: {e}")
+            if on_failure is not None:
+                on_failure(params, e)
+        except Exception as e:
+            print(f"DB Error (stopped after {i} of {len(params_list)} rows): {e}")
+            return results
+
+        # Skip the bad row for good (its in_transaction bookkeeping still has to move past it)
+        if in_transaction is not None:
+            try:
+                run_with_retry(lambda conn: (in_transaction(conn, i + 1), conn.commit()))
+            except Exception as e:
+                print(f"DB Error (stopped after {i} of {len(params_list)} rows): {e}")
+                return results
+        results.append(None)
+    return results
+
+
+_group_writer = None
+_group_writer_pid = None
+_group_writer_lock = threading.Lock()
+
+
+def _get_group_writer():
+    global _group_writer, _group_writer_pid
+    with _group_writer_lock:
+        # Threads do not survive fork, so each worker starts its own writer
+        if _group_writer is None or _group_writer_pid != os.getpid():
+            _group_writer = GroupCommitWriter(GROUP_COMMIT_MS, GROUP_COMMIT_ROWS)
+            _group_writer_pid = os.getpid()
+        return _group_writer
 
+@instrumentation.timed('determine_tier')
 def determine_tier(game_type, score):
     # Basic Tier Logic (can be expanded)
     # This should match frontend logic if possible
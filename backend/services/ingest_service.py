@@ -0,0 +1,303 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so run a single worker there
+    fcntl = None
+
+from services import db_service
+
+# Asynchronous score ingestion. Request threads append the submission to a
+# local spool file and an in-memory queue, then return without touching
+# SQLite. A background writer drains the queue in batches through
+# db_service.write_batch. The spool read offset (ingest_spool table) is
+# committed in the same transaction as the rows, so after a crash only
+# unwritten entries are replayed. Rows SQLite rejects outright are moved to
+# rejected.jsonl instead of blocking the queue. Spool files are only fsync'd
+# when BRAIN_INGEST_SPOOL_FSYNC=1; otherwise they survive a process crash,
+# but an OS crash can lose the last few entries.
+
+SPOOL_DIR = os.environ.get('BRAIN_INGEST_SPOOL_DIR', os.path.join(db_service.BASE_DIR, 'spool'))
+MAX_QUEUE_DEPTH = int(os.environ.get('BRAIN_INGEST_MAX_DEPTH', 10000))
+BATCH_SIZE = int(os.environ.get('BRAIN_INGEST_BATCH_SIZE', 500))
+FLUSH_MS = int(os.environ.get('BRAIN_INGEST_FLUSH_MS', 50))
+SPOOL_FSYNC = os.environ.get('BRAIN_INGEST_SPOOL_FSYNC', '0') == '1'
+SPOOL_ROTATE_BYTES = 4 * 1024 * 1024
+RETRY_DELAY = 0.5  # seconds, when the database stays locked
+REJECTED_FILE = 'rejected.jsonl'  # rows SQLite refused, never replayed
+
+
+class QueueFull(Exception):
+    """
+    The ingestion queue is at MAX_QUEUE_DEPTH; callers should answer 503.
+    """
+
+
+class _Spool:
+    def __init__(self, path, fd):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.fd = fd
+        self.size = 0        # end offset of the last complete entry
+        self.committed = 0   # end offset of the last entry written to SQLite
+        self.retired = False  # no more appends; delete once fully committed
+
+
+def _open_spool(path):
+    """
+    Opens (creating if needed) and exclusively locks a spool file; None if
+    another live process holds it.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, 'O_BINARY', 0), 0o644)
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+    return _Spool(path, fd)
+
+
+def _spool_offsets(items):
+    # Highest committed end offset per spool file
+    offsets = {}
+    for _, spool, end in items:
+        offsets[spool.name] = max(offsets.get(spool.name, 0), end)
+    return offsets
+
+
+class IngestQueue:
+    """
+    Bounded in-memory queue backed by spool files, drained by one writer thread.
+    """
+
+    def __init__(self):
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        self._items = deque()  # (params, spool, end_offset)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._spools = {}
+        self._current = None
+        self._stopping = False
+        self._latencies = deque(maxlen=1000)
+        self._stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'replayed': 0,
+            'batches': 0,
+            'rows_written': 0,
+            'rows_failed': 0,
+            'flush_errors': 0,
+            'last_batch_size': 0,
+        }
+        self._replay()
+        self._rotate()
+        self._thread = threading.Thread(target=self._run, name='score-ingest', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _rotate(self):
+        # Caller holds the lock (or we are still in __init__)
+        if self._current is not None:
+            self._current.retired = True
+        name = f"ingest-{os.getpid()}-{time.time_ns()}.jsonl"
+        self._current = _open_spool(os.path.join(SPOOL_DIR, name))
+        self._spools[self._current.name] = self._current
+
+    def _replay(self):
+        """
+        Re-queues entries left in spool files by a crashed or stopped process.
+        """
+        for path in sorted(glob.glob(os.path.join(SPOOL_DIR, 'ingest-*.jsonl'))):
+            spool = _open_spool(path)
+            if spool is None:
+                continue  # owned by a live worker
+            row = db_service.run_with_retry(lambda conn: conn.execute(
+                'SELECT committed_offset FROM ingest_spool WHERE spool = ?', (spool.name,)).fetchone())
+            spool.committed = spool.size = row[0] if row else 0
+            spool.retired = True
+            self._spools[spool.name] = spool
+
+            with open(path, 'rb') as f:
+                f.seek(spool.committed)
+                data = f.read()
+            offset = spool.committed
+            queued = 0
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b'\n'):
+                    break  # torn write at crash time
+                offset += len(line)
+                try:
+                    params = json.loads(line)
+                except ValueError:
+                    print(f"Ingest Replay: skipping corrupt entry in {spool.name}")
+                    continue
+                self._items.append((params, spool, offset))
+                queued += 1
+            self._stats['replayed'] += queued
+            spool.size = offset
+            if not queued:
+                # Everything in it is already in SQLite (or unreadable)
+                spool.committed = spool.size
+                self._cleanup([spool])
+
+    def submit(self, params):
+        line = (json.dumps(params, separators=(',', ':')) + '\n').encode()
+        with self._cond:
+            if len(self._items) >= MAX_QUEUE_DEPTH:
+                self._stats['rejected'] += 1
+                raise QueueFull()
+            if self._current.size >= SPOOL_ROTATE_BYTES:
+                self._rotate()
+            spool = self._current
+            os.write(spool.fd, line)
+            if SPOOL_FSYNC:
+                os.fsync(spool.fd)
+            spool.size += len(line)
+            self._items.append((params, spool, spool.size))
+            self._stats['enqueued'] += 1
+            if len(self._items) == 1 or len(self._items) >= BATCH_SIZE:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._stopping:
+                    self._cond.wait()
+                if not self._items:
+                    return
+                # Collect more rows for up to FLUSH_MS
+                if len(self._items) < BATCH_SIZE and not self._stopping:
+                    self._cond.wait(FLUSH_MS / 1000.0)
+                batch = [self._items.popleft() for _ in range(min(BATCH_SIZE, len(self._items)))]
+                self._in_flight = len(batch)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        def write_offsets(conn, count):
+            # Same transaction as the first count rows of the batch
+            self._write_offsets(conn, _spool_offsets(batch[:count]))
+
+        start = time.perf_counter()
+        try:
+            results = db_service.write_batch([item[0] for item in batch], in_transaction=write_offsets,
+                                             on_failure=self._reject)
+        except Exception as e:
+            print(f"Ingest Error (batch of {len(batch)} rows, will retry): {e}")
+            results = []
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        done = batch[:len(results)]
+        with self._cond:
+            self._in_flight = 0
+            if len(done) < len(batch):
+                # Only the tail that never reached SQLite goes back on the queue
+                self._items.extendleft(reversed(batch[len(done):]))
+                self._stats['flush_errors'] += 1
+            if done:
+                self._latencies.append(elapsed_ms)
+                self._stats['batches'] += 1
+                self._stats['last_batch_size'] = len(done)
+                failed = sum(1 for r in results if r is None)
+                self._stats['rows_written'] += len(done) - failed
+                self._stats['rows_failed'] += failed
+                for name, end in _spool_offsets(done).items():
+                    self._spools[name].committed = end
+        if done:
+            self._cleanup(list(self._spools.values()))
+        if len(done) < len(batch):
+            time.sleep(RETRY_DELAY)
+
+    def _reject(self, params, error):
+        # Rows SQLite refuses for good are skipped; keep them for inspection
+        line = json.dumps({"params": params, "error": str(error)}, separators=(',', ':')) + '\n'
+        with open(os.path.join(SPOOL_DIR, REJECTED_FILE), 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_offsets(self, conn, offsets):
+        conn.executemany('''
+            INSERT INTO ingest_spool (spool, committed_offset) VALUES (?, ?)
+            ON CONFLICT(spool) DO UPDATE SET
+                committed_offset = MAX(committed_offset, excluded.committed_offset)
+        ''', list(offsets.items()))
+
+    def _cleanup(self, spools):
+        # Delete retired spool files whose every entry is in SQLite
+        done = [s for s in spools if s.retired and s.committed >= s.size]
+        for spool in done:
+            os.close(spool.fd)
+            os.remove(spool.path)
+            with self._cond:
+                self._spools.pop(spool.name, None)
+        if done:
+            db_service.run_with_retry(lambda conn: (
+                conn.executemany('DELETE FROM ingest_spool WHERE spool = ?', [(s.name,) for s in done]),
+                conn.commit()))
+
+    def stop(self, timeout=10):
+        """
+        Drains the queue and stops the writer (registered with atexit).
+        """
+        with self._cond:
+            if self._stopping:
+                return
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        with self._cond:
+            self._current.retired = True
+        self._cleanup([self._current])
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['depth'] = len(self._items) + self._in_flight
+            stats['max_depth'] = MAX_QUEUE_DEPTH
+            stats['spool_files'] = len(self._spools)
+            latencies = sorted(self._latencies)
+        if latencies:
+            stats['flush_latency_ms'] = {
+                'last': round(self._latencies[-1], 3),
+                'p50': round(latencies[len(latencies) // 2], 3),
+                'p99': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+                'max': round(latencies[-1], 3),
+            }
+        if stats['batches']:
+            stats['avg_batch_size'] = round(stats['rows_written'] / stats['batches'], 1)
+        return stats
+
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue, _queue_pid
+    with _queue_lock:
+        # Threads and spool locks do not carry over a fork: one queue per worker
+        if _queue is None or _queue_pid != os.getpid():
+            _queue = IngestQueue()
+            _queue_pid = os.getpid()
+        return _queue
+
+
+def enqueue_score(user_id, game_type, score):
+    """
+    Queues a submission for the background writer. Raises QueueFull under backpressure.
+    """
+    get_queue().submit(db_service.make_result_params(user_id, game_type, score))
+
+
+def get_ingest_stats():
+    if _queue is None or _queue_pid != os.getpid():
+        return {'depth': 0, 'started': False}
+    return _queue.get_stats()
@@ -0,0 +1,345 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from functools import wraps
+
+# Opt-in request/hot-path instrumentation (BRAIN_INSTRUMENT=1):
+#   - per-route latency histograms (Flask before/after_request hooks)
+#   - span histograms around get_db_connection, each SQL statement, lock
+#     waits, calculate_percentile, determine_tier, JSON parsing
+#   - slow requests (> BRAIN_SLOW_REQUEST_MS) logged with their span
+#     breakdown; a sampled fraction (BRAIN_PROFILE_SAMPLE_RATE) also runs under
+#     cProfile, and in-flight requests past the threshold get a stack dump
+# When disabled, span() returns a shared no-op, timed() returns the function
+# unchanged and connections use the plain sqlite3 class, so the hot paths
+# pay nothing. /api/metrics renders everything in Prometheus text format.
+
+ENABLED = os.environ.get('BRAIN_INSTRUMENT', '0') == '1'
+SLOW_REQUEST_MS = float(os.environ.get('BRAIN_SLOW_REQUEST_MS', 500))
+PROFILE_SAMPLE_RATE = float(os.environ.get('BRAIN_PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('BRAIN_PROFILE_DIR',
+                             os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'profiles'))
+
+# Seconds; Prometheus convention
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += seconds
+        self.count += 1
+
+
+_histograms = {}  # (metric, labels tuple) -> Histogram
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def observe(metric, labels, seconds):
+    key = (metric, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(seconds)
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        observe('brain_span_duration_seconds', (('span', self.name),), elapsed)
+        spans = getattr(_local, 'spans', None)
+        if spans is not None:
+            spans.append((self.name, elapsed))
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name):
+    """
+    Context manager timing a block into the span histogram (no-op when disabled).
+    """
+    return _Span(name) if ENABLED else _NOOP
+
+
+def timed(name):
+    """
+    Decorator version of span(); leaves the function untouched when disabled.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- SQLite statements ----------------------------------------------------
+
+_STATEMENT_RE = re.compile(r'\b(?:INTO|FROM|UPDATE)\s+(\w+)', re.IGNORECASE)
+_labels = {}
+
+
+def _statement_label(sql):
+    # Low-cardinality label such as "INSERT game_logs" (cached per SQL string)
+    label = _labels.get(sql)
+    if label is None:
+        words = sql.split(None, 1)
+        verb = words[0].upper() if words else '?'
+        table = _STATEMENT_RE.search(sql)
+        label = f"{verb} {table.group(1)}" if table else verb
+        if len(_labels) < 1000:
+            _labels[sql] = label
+    return label
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that times every statement and commit as a span.
+    """
+
+    def execute(self, sql, *args):
+        with _Span(f"sql:{_statement_label(sql)}"):
+            return super().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        with _Span(f"sql:{_statement_label(sql)}"):
+            return super().executemany(sql, *args)
+
+    def commit(self):
+        with _Span('sql:COMMIT'):
+            return super().commit()
+
+
+def connection_factory():
+    return TimedConnection if ENABLED else sqlite3.Connection
+
+
+# --- Flask requests -------------------------------------------------------
+
+_active = {}  # thread id -> [start, route, dumped]
+
+
+def init_app(app):
+    """
+    Installs the request hooks and the slow-request watchdog (only when enabled).
+    """
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_request():
+        g._instrument_start = time.perf_counter()
+        _local.spans = []
+        g._profiler = None
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            g._profiler = _start_profiler()
+        _active[threading.get_ident()] = [time.perf_counter(), request.path, False]
+
+    @app.after_request
+    def _finish_request(response):
+        start = getattr(g, '_instrument_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            _stop_profiler(profiler)
+
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe('brain_request_duration_seconds',
+                (('route', route), ('method', request.method), ('status', str(response.status_code))),
+                elapsed)
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            _report_slow(route, request.method, elapsed, _local.spans, profiler)
+        return response
+
+    @app.teardown_request
+    def _cleanup_request(exc):
+        # Also runs when the view raised and after_request was skipped
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            _stop_profiler(profiler)
+        _active.pop(threading.get_ident(), None)
+        _local.spans = None
+
+    if SLOW_REQUEST_MS > 0:
+        threading.Thread(target=_watchdog, name='slow-request-watchdog', daemon=True).start()
+
+
+_profile_lock = threading.Lock()  # one profiled request at a time
+
+
+def _start_profiler():
+    # Python 3.12+ allows a single active profiler per process; sample skipped if taken
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiling tool is active
+        _profile_lock.release()
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler):
+    # Callers pop the profiler off g first, so this runs once per request
+    profiler.disable()
+    _profile_lock.release()
+
+
+def _write_report(prefix, text):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{prefix}-{os.getpid()}-{time.time_ns()}.txt")
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def _report_slow(route, method, elapsed, spans, profiler):
+    totals = {}
+    for name, seconds in spans or []:
+        totals[name] = totals.get(name, 0.0) + seconds
+    breakdown = ', '.join(f"{name}={seconds * 1000:.1f}ms"
+                          for name, seconds in sorted(totals.items(), key=lambda x: -x[1]))
+    line = f"Slow request: {method} {route} {elapsed * 1000:.1f}ms [{breakdown}]"
+    if profiler is None:
+        print(line)
+        return
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+    path = _write_report('profile', f"{line}\n\n{out.getvalue()}")
+    print(f"{line} profile={path}")
+
+
+def _watchdog():
+    # Dump the stack of requests still running past the threshold (once each)
+    interval = max(SLOW_REQUEST_MS / 2000.0, 0.05)
+    while True:
+        time.sleep(interval)
+        now = time.perf_counter()
+        frames = None
+        for thread_id, entry in list(_active.items()):
+            start, path, dumped = entry
+            if dumped or (now - start) * 1000 < SLOW_REQUEST_MS:
+                continue
+            entry[2] = True
+            if frames is None:
+                frames = sys._current_frames()
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = ''.join(traceback.format_stack(frame))
+            report = _write_report('stack', f"In-flight request {path} at {(now - start) * 1000:.0f}ms\n\n{stack}")
+            print(f"Slow request still running: {path} stack={report}")
+
+
+# --- Prometheus text format -----------------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+HELP = {
+    'brain_request_duration_seconds': 'Flask request latency by route, method and status.',
+    'brain_span_duration_seconds': 'Hot-path span latency (DB connection, SQL statements, percentile, tier).',
+}
+
+
+def render_prometheus(stats=None):
+    """
+    Histograms plus the given {metric_name: (type, number)} stats in Prometheus text format.
+    """
+    with _lock:
+        snapshot = [(metric, labels, list(h.counts), h.total, h.count)
+                    for (metric, labels), h in sorted(_histograms.items())]
+
+    lines = []
+    seen = set()
+    for metric, labels, counts, total, count in snapshot:
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ('+Inf',), counts):
+            cumulative += n
+            lines.append(f"{metric}_bucket{_labels_text(labels + (('le', bound),))} {cumulative}")
+        lines.append(f"{metric}_sum{_labels_text(labels)} {total}")
+        lines.append(f"{metric}_count{_labels_text(labels)} {count}")
+
+    for name, (kind, value) in sorted((stats or {}).items()):
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def flatten_stats(prefix, stats, counters=()):
+    """
+    {'hits': 3, 'latency': {'p99': 1.2}} -> {'<prefix>_hits_total': ('counter', 3),
+    '<prefix>_latency_p99': ('gauge', 1.2)} when 'hits' is in counters (values
+    that only ever go up); everything else is a gauge. Non-numbers are dropped.
+    """
+    flat = {}
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_stats(name, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if key in counters:
+                flat[f"{name}_total"] = ('counter', value)
+            else:
+                flat[name] = ('gauge', value)
+    return flat
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Read-through cache of serialized /api/leaderboard responses, one entry per
+# game_type. Entries are dropped when a save changes that game's top-N
+# (db_service), after TTL_SECONDS, or when the LRU is full. The TTL also bounds
+# how stale a worker can be about saves handled by other workers.
+
+TTL_SECONDS = float(os.environ.get('BRAIN_LEADERBOARD_CACHE_TTL', 30))
+MAX_ENTRIES = int(os.environ.get('BRAIN_LEADERBOARD_CACHE_SIZE', 256))
+LEADERBOARD_LIMIT = 10
+
+_entries = OrderedDict()  # game_type -> (body bytes, etag, expires_at)
+_generations = {}  # game_type -> invalidation count, guards against caching a pre-save read
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+
+def make_etag(body):
+    return hashlib.sha1(body).hexdigest()[:20]
+
+
+def get(game_type):
+    """
+    Returns (body, etag, generation); body and etag are None on a miss.
+    Pass generation back to put() so a read that raced a save is not cached.
+    """
+    with _lock:
+        generation = _generations.get(game_type, 0)
+        entry = _entries.get(game_type)
+        if entry is None or entry[2] < time.monotonic():
+            if entry is not None:
+                del _entries[game_type]
+            _stats['misses'] += 1
+            return None, None, generation
+        _entries.move_to_end(game_type)
+        _stats['hits'] += 1
+        return entry[0], entry[1], generation
+
+
+def put(game_type, body, generation):
+    """
+    Stores a serialized response body unless the game was invalidated since
+    get() returned generation; returns its etag either way.
+    """
+    etag = make_etag(body)
+    with _lock:
+        if _generations.get(game_type, 0) != generation:
+            return etag
+        _entries[game_type] = (body, etag, time.monotonic() + TTL_SECONDS)
+        _entries.move_to_end(game_type)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats['evictions'] += 1
+    return etag
+
+
+def invalidate(game_type):
+    with _lock:
+        _generations[game_type] = _generations.get(game_type, 0) + 1
+        if _entries.pop(game_type, None) is not None:
+            _stats['invalidations'] += 1
+
+
+def get_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats['entries'] = len(_entries)
+    return stats
@@ -0,0 +1,81 @@
+import math
+import numpy as np
+from services import quantile_sketch, instrumentation
+from services import stats_service
+from services.stats_service import STATS_DATA, normal_cdf
+
+# Batch percentile engine: one NumPy pass over many (game_type, score) pairs.
+# The standard normal CDF is tabulated once at import on a fine z grid and
+# evaluated with cubic Hermite interpolation (the pdf is the exact slope),
+# which stays within ~1e-10 of the closed form, far below the 2-decimal
+# rounding of calculate_percentile.
+
+Z_MAX = 9.0        # CDF is 0 / 1 to double precision beyond this
+Z_STEP = 1.0 / 64
+
+_Z_GRID = np.arange(-Z_MAX, Z_MAX + Z_STEP / 2, Z_STEP)
+_CDF_TABLE = np.array([normal_cdf(z) for z in _Z_GRID])
+_PDF_TABLE = np.exp(-0.5 * _Z_GRID ** 2) / math.sqrt(2 * math.pi)
+
+# Per-game parameters as arrays, indexed by position in GAME_TYPES
+GAME_TYPES = list(STATS_DATA.keys())
+GAME_INDEX = {game_type: i for i, game_type in enumerate(GAME_TYPES)}
+_MEANS = np.array([STATS_DATA[g]['mean'] for g in GAME_TYPES], dtype=float)
+_STD_DEVS = np.array([STATS_DATA[g]['std_dev'] for g in GAME_TYPES], dtype=float)
+_LOWER_IS_BETTER = np.array([STATS_DATA[g].get('lower_is_better', False) for g in GAME_TYPES])
+
+
+def normal_cdf_array(z):
+    """
+    Vectorized standard normal CDF via the lookup table.
+    """
+    z = np.clip(np.asarray(z, dtype=float), -Z_MAX, Z_MAX)
+    pos = (z + Z_MAX) / Z_STEP
+    i = np.minimum(pos.astype(np.intp), len(_Z_GRID) - 2)
+    t = pos - i
+    t2 = t * t
+    t3 = t2 * t
+    # Cubic Hermite basis
+    h00 = 2 * t3 - 3 * t2 + 1
+    h10 = t3 - 2 * t2 + t
+    h01 = -2 * t3 + 3 * t2
+    h11 = t3 - t2
+    return (h00 * _CDF_TABLE[i] + h10 * Z_STEP * _PDF_TABLE[i]
+            + h01 * _CDF_TABLE[i + 1] + h11 * Z_STEP * _PDF_TABLE[i + 1])
+
+
+def _empirical_cdf_array(view, scores):
+    # Same mid-rank rule as KLLSketch.cdf, vectorized over scores
+    values = np.asarray(view[0])
+    cumulative = np.concatenate(([0], view[1]))
+    below = cumulative[np.searchsorted(values, scores, side='left')]
+    through = cumulative[np.searchsorted(values, scores, side='right')]
+    return (below + (through - below) / 2) / cumulative[-1]
+
+
+@instrumentation.timed('calculate_percentiles')
+def calculate_percentiles(game_types, scores):
+    """
+    Batch version of stats_service.calculate_percentile.
+    game_types: sequence of game_type strings; scores: array-like of numbers.
+    Returns a float array of percentiles rounded to 2 decimals (0.0 for unknown games).
+    """
+    scores = np.asarray(scores, dtype=float)
+    idx = np.array([GAME_INDEX.get(g, -1) for g in game_types], dtype=np.intp)
+    if idx.shape != scores.shape:
+        raise ValueError("game_types and scores must have the same length")
+
+    known = idx >= 0
+    safe_idx = np.where(known, idx, 0)
+    cdf = normal_cdf_array((scores - _MEANS[safe_idx]) / _STD_DEVS[safe_idx]) * 100
+
+    if stats_service.PERCENTILE_MODE == 'empirical':
+        for i in np.unique(idx[known]):
+            view = quantile_sketch.get_sorted_view(GAME_TYPES[i], stats_service.MIN_EMPIRICAL_SAMPLES)
+            if view is not None:
+                mask = idx == i
+                cdf[mask] = _empirical_cdf_array(view, scores[mask]) * 100
+
+    # Lower-is-better games (times): beating the population means a small CDF
+    percentile = np.where(_LOWER_IS_BETTER[safe_idx], 100 - cdf, cdf)
+    return np.where(known, np.round(percentile, 2), 0.0)
@@ -0,0 +1,193 @@
+import bisect
+import json
+import math
+import random
+import threading
+
+# Streaming quantile sketches (KLL) of the real score distribution, one per
+# game_type. They are fed from game_logs in id order (db_service.refresh_sketches)
+# so any worker can catch up on rows written by others, and are persisted to
+# the percentile_sketches table so a restart does not re-read every log row.
+
+SKETCH_K = 200  # accuracy/size trade-off: rank error ~1.7 / k, a few hundred floats per game
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch: a stack of compactors where items at level h weigh 2**h.
+    When full, a level is sorted and every other item is promoted a level up.
+    """
+
+    def __init__(self, k=SKETCH_K, seed=None):
+        self.k = k
+        self.count = 0
+        self.compactors = [[]]
+        self._size = 0
+        self._rng = random.Random(seed)
+        self._view = None
+        self._update_max_size()
+
+    def _capacity(self, h):
+        height = len(self.compactors)
+        return int(math.ceil(self.k * (2 / 3) ** (height - h - 1))) + 1
+
+    def _update_max_size(self):
+        self.max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def update(self, x):
+        self.compactors[0].append(float(x))
+        self.count += 1
+        self._size += 1
+        self._view = None
+        if self._size >= self.max_size:
+            self._compress()
+
+    def _compress(self):
+        for h in range(len(self.compactors)):
+            if len(self.compactors[h]) >= self._capacity(h):
+                if h + 1 >= len(self.compactors):
+                    self.compactors.append([])
+                    self._update_max_size()
+                items = sorted(self.compactors[h])
+                leftover = [items.pop()] if len(items) % 2 else []
+                offset = self._rng.randint(0, 1)
+                self.compactors[h + 1].extend(items[offset::2])
+                self.compactors[h] = leftover
+                self._size = sum(len(c) for c in self.compactors)
+                break
+
+    def sorted_view(self):
+        """
+        (values, cumulative weights) over all retained items, sorted by value.
+        """
+        if self._view is None:
+            weighted = sorted((x, 1 << h) for h, comp in enumerate(self.compactors) for x in comp)
+            values = [x for x, _ in weighted]
+            cumulative = []
+            total = 0
+            for _, w in weighted:
+                total += w
+                cumulative.append(total)
+            self._view = (values, cumulative)
+        return self._view
+
+    def cdf(self, x):
+        """
+        Fraction of the population below x, counting ties as half (mid-rank).
+        """
+        values, cumulative = self.sorted_view()
+        if not values:
+            return None
+        total = cumulative[-1]
+        lo = bisect.bisect_left(values, x)
+        hi = bisect.bisect_right(values, x)
+        below = cumulative[lo - 1] if lo else 0
+        through = cumulative[hi - 1] if hi else 0
+        return (below + (through - below) / 2) / total
+
+    def to_json(self):
+        return json.dumps({"k": self.k, "count": self.count, "compactors": self.compactors})
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        sketch = cls(k=data["k"])
+        sketch.count = data["count"]
+        sketch.compactors = data["compactors"] or [[]]
+        sketch._size = sum(len(c) for c in sketch.compactors)
+        sketch._update_max_size()
+        return sketch
+
+
+# game_type -> {"sketch": KLLSketch, "last_log_id": int}
+_state = {}
+_lock = threading.Lock()
+_dirty = False
+_scanned_through = 0  # every game_logs row with id <= this has been applied
+
+
+def apply_logs(rows):
+    """
+    Feeds game_logs rows (id, game_type, score) in id order; rows a game's
+    sketch has already seen are skipped. Returns the number applied.
+    """
+    global _dirty, _scanned_through
+    applied = 0
+    with _lock:
+        for log_id, game_type, score in rows:
+            _scanned_through = max(_scanned_through, log_id)
+            entry = _state.get(game_type)
+            if entry is None:
+                entry = _state[game_type] = {"sketch": KLLSketch(), "last_log_id": 0}
+            if log_id <= entry["last_log_id"] or score is None:
+                continue
+            entry["sketch"].update(score)
+            entry["last_log_id"] = log_id
+            applied += 1
+        if applied:
+            _dirty = True
+    return applied
+
+
+def last_log_id():
+    """
+    Highest game_logs id already applied (scan from here).
+    """
+    with _lock:
+        return _scanned_through
+
+
+def sample_count(game_type):
+    with _lock:
+        entry = _state.get(game_type)
+        return entry["sketch"].count if entry else 0
+
+
+def empirical_cdf(game_type, score, min_samples):
+    """
+    Empirical P(score) in [0, 1], or None if the game has fewer than min_samples plays.
+    """
+    with _lock:
+        entry = _state.get(game_type)
+        if entry is None or entry["sketch"].count < min_samples:
+            return None
+        return entry["sketch"].cdf(score)
+
+
+def get_sorted_view(game_type, min_samples):
+    """
+    The sketch's (values, cumulative weights) for batch lookups, or None below min_samples.
+    """
+    with _lock:
+        entry = _state.get(game_type)
+        if entry is None or entry["sketch"].count < min_samples:
+            return None
+        return entry["sketch"].sorted_view()
+
+
+def load(rows):
+    """
+    Restores sketches from percentile_sketches rows (game_type, sketch, last_log_id).
+    """
+    global _scanned_through
+    rows = list(rows)
+    with _lock:
+        for game_type, text, log_id in rows:
+            _state[game_type] = {"sketch": KLLSketch.from_json(text), "last_log_id": log_id}
+        # Rows are written together, but take the oldest in case a write raced
+        _scanned_through = min((row[2] for row in rows), default=0)
+
+
+def snapshot():
+    """
+    Serialized rows (game_type, sketch, sample_count, last_log_id) if anything changed
+    since the last snapshot, else an empty list. Every sketch has seen all of its
+    game's rows up to the scan watermark, so that is stored as each row's last_log_id.
+    """
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return []
+        _dirty = False
+        return [(game_type, entry["sketch"].to_json(), entry["sketch"].count, _scanned_through)
+                for game_type, entry in _state.items()]
@@ -0,0 +1,238 @@
+import math
+import random
+import threading
+from services.stats_service import STATS_DATA
+
+# In-memory ranked leaderboards, one per game_type.
+# Warmed from user_stats at startup (db_service.warm_rank_index) and updated
+# after every committed save, so top-K, a player's exact rank and the players
+# around them are all O(log n) instead of a table scan or a list re-sort.
+# Each process keeps its own index; under several gunicorn workers a worker
+# picks up other workers' saves on its next incremental refresh from
+# user_stats (db_service.refresh_rank_index, every RANK_REFRESH_SECONDS).
+
+MAX_LEVELS = 24  # enough for ~16M entries per game
+
+
+class _Node:
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+
+class IndexableSkiplist:
+    """
+    Sorted container with O(log n) insert, remove, rank and positional access.
+    width[level] counts base-level steps to next[level] (None = end of list).
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.head = _Node(None, MAX_LEVELS)
+        self._random = random.Random(0)
+
+    def __len__(self):
+        return self.size
+
+    def _find_chain(self, value):
+        chain = [None] * MAX_LEVELS
+        steps = [0] * MAX_LEVELS
+        node = self.head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].value < value:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        return chain, steps
+
+    def insert(self, value):
+        chain, steps_at_level = self._find_chain(value)
+        levels = min(MAX_LEVELS, 1 - int(math.log(1.0 - self._random.random(), 2.0)))
+        new_node = _Node(value, levels)
+        steps = 0
+        for level in range(levels):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        chain, _ = self._find_chain(value)
+        target = chain[0].next[0]
+        if target is None or target.value != value:
+            raise KeyError(value)
+        for level in range(MAX_LEVELS):
+            prev = chain[level]
+            if prev.next[level] is target:
+                prev.width[level] += target.width[level] - 1
+                prev.next[level] = target.next[level]
+            else:
+                prev.width[level] -= 1
+        self.size -= 1
+
+    def count_less(self, value):
+        """
+        Number of stored values strictly less than value.
+        """
+        node = self.head
+        position = 0
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def iter_from(self, index):
+        """
+        Yields values in order starting at position index (0-based).
+        """
+        if index >= self.size:
+            return
+        node = self.head
+        remaining = index + 1
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        while node is not None:
+            yield node.value
+            node = node.next[0]
+
+
+class GameRanking:
+    """
+    Ranked leaderboard for one game. Each player appears once, at their best
+    score; ties share a rank (1, 2, 2, 4, ...).
+    """
+
+    def __init__(self, lower_is_better=False):
+        self.lower_is_better = lower_is_better
+        self._list = IndexableSkiplist()
+        self._players = {}  # user_id -> (key, entry, version)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._list)
+
+    def _sort_score(self, score):
+        # Rank 1 is always the smallest key
+        return score if self.lower_is_better else -score
+
+    def update(self, user_id, score, entry, version=None):
+        """
+        Stores entry as the player's row at the given score; returns the new rank.
+        With a version, an update no newer than the stored one is ignored
+        (saves committed in one order can reach the index in another).
+        """
+        key = (self._sort_score(score), user_id)
+        with self._lock:
+            old = self._players.get(user_id)
+            if version is not None and old is not None and old[2] is not None and version <= old[2]:
+                return self._list.count_less(old[0][:1]) + 1
+            if old is not None and old[0] != key:
+                self._list.remove(old[0])
+            if old is None or old[0] != key:
+                self._list.insert(key)
+            self._players[user_id] = (key, entry, version)
+            return self._list.count_less(key[:1]) + 1
+
+    def get(self, user_id):
+        with self._lock:
+            player = self._players.get(user_id)
+            return dict(player[1]) if player is not None else None
+
+    def rank(self, user_id):
+        with self._lock:
+            player = self._players.get(user_id)
+            if player is None:
+                return None
+            return self._list.count_less(player[0][:1]) + 1
+
+    def _entries_from(self, index, count):
+        # Caller holds the lock
+        rows = []
+        prev_score = None
+        rank = None
+        for position, key in enumerate(self._list.iter_from(index), start=index):
+            if len(rows) >= count:
+                break
+            if rank is None:
+                rank = self._list.count_less(key[:1]) + 1
+            elif key[0] != prev_score:
+                rank = position + 1
+            prev_score = key[0]
+            row = dict(self._players[key[1]][1])
+            row['rank'] = rank
+            rows.append(row)
+        return rows
+
+    def top(self, k=10):
+        with self._lock:
+            return self._entries_from(0, k)
+
+    def around(self, user_id, radius=5):
+        """
+        The player's row plus up to radius rows on either side.
+        """
+        with self._lock:
+            player = self._players.get(user_id)
+            if player is None:
+                return []
+            position = self._list.count_less(player[0])
+            start = max(0, position - radius)
+            return self._entries_from(start, position - start + radius + 1)
+
+
+_rankings = {}
+_rankings_lock = threading.Lock()
+
+
+def get_ranking(game_type):
+    with _rankings_lock:
+        ranking = _rankings.get(game_type)
+        if ranking is None:
+            lower_is_better = STATS_DATA.get(game_type, {}).get('lower_is_better', False)
+            ranking = _rankings[game_type] = GameRanking(lower_is_better)
+        return ranking
+
+
+def record_result(game_type, user_id, best_score, tier, total_plays):
+    """
+    Applies a committed user_stats row to the index; returns the player's rank.
+    total_plays only grows, so it orders rows for the same player.
+    """
+    entry = {"user_id": user_id, "best_score": best_score, "tier": tier, "total_plays": total_plays}
+    return get_ranking(game_type).update(user_id, best_score, entry, version=total_plays)
+
+
+def load_user_stats(rows):
+    """
+    Rebuilds the index from user_stats rows (user_id, game_type, best_score, tier, total_plays).
+    """
+    global _rankings
+    with _rankings_lock:
+        _rankings = {}
+    count = 0
+    for row in rows:
+        record_result(row['game_type'], row['user_id'], row['best_score'], row['tier'], row['total_plays'])
+        count += 1
+    return count
+
+
+def get_player_rank(game_type, user_id, radius=5):
+    """
+    Returns {"rank", "total", "neighbors"} for a player, or None if unranked.
+    """
+    ranking = get_ranking(game_type)
+    rank = ranking.rank(user_id)
+    if rank is None:
+        return None
+    return {"rank": rank, "total": len(ranking), "neighbors": ranking.around(user_id, radius)}
@@ -0,0 +1,170 @@
+from services.stats_service import STATS_DATA
+
+# Daily / weekly per-game rollups of game_logs (count, min, max, sum and a
+# histogram), kept up to date inside the same transaction as each log insert.
+# Trend queries read these small tables instead of scanning game_logs, which
+# lets old raw rows be compacted away (compact_game_logs) without losing history.
+# All functions take an open connection; db_service wraps them.
+
+# Bucket label per period, as an SQL expression over a timestamp/date.
+# Weeks are labelled by their Monday, so one spanning New Year stays whole.
+PERIODS = {
+    'day': "date({})",
+    'week': "date({}, '-6 days', 'weekday 1')",
+}
+
+# Histogram: HISTOGRAM_BINS bins of half a std_dev, covering mean +/- 4 std_dev
+HISTOGRAM_BINS = 16
+
+
+def histogram_bin(game_type, score):
+    """
+    Histogram bin (0..HISTOGRAM_BINS-1) for a score; registered as an SQL function.
+    """
+    data = STATS_DATA.get(game_type)
+    if data is None or score is None:
+        return 0
+    low = data['mean'] - 4 * data['std_dev']
+    b = int((score - low) // (data['std_dev'] / 2))
+    return min(max(b, 0), HISTOGRAM_BINS - 1)
+
+
+def _bucket_expr(period, value):
+    return PERIODS[period].format(value)
+
+
+def _bucket_select(columns, where, group_by=''):
+    # One SELECT per period over game_logs, glued with UNION ALL
+    return '\nUNION ALL\n'.join(
+        f"SELECT '{period}', {_bucket_expr(period, 'created_at')}, {columns} FROM game_logs WHERE {where} {group_by}"
+        for period in PERIODS
+    )
+
+
+RECORD_ROLLUP_SQL = f'''
+    INSERT INTO score_rollups (period, bucket, game_type, plays, min_score, max_score, sum_score)
+    {_bucket_select('game_type, 1, score, score, score', 'id = :log_id')}
+    ON CONFLICT(period, bucket, game_type) DO UPDATE SET
+        plays = plays + excluded.plays,
+        min_score = MIN(min_score, excluded.min_score),
+        max_score = MAX(max_score, excluded.max_score),
+        sum_score = sum_score + excluded.sum_score
+'''
+
+RECORD_BIN_SQL = f'''
+    INSERT INTO score_rollup_bins (period, bucket, game_type, bin, plays)
+    {_bucket_select('game_type, histogram_bin(game_type, score), 1', 'id = :log_id')}
+    ON CONFLICT(period, bucket, game_type, bin) DO UPDATE SET
+        plays = plays + excluded.plays
+'''
+
+
+def record_play(conn, params):
+    """
+    Folds the game_logs row params["log_id"] into its day and week rollups (no commit).
+    """
+    conn.execute(RECORD_ROLLUP_SQL, params)
+    conn.execute(RECORD_BIN_SQL, params)
+
+
+def rebuild_rollups(conn):
+    """
+    Recomputes all rollups from the raw rows still in game_logs (no commit).
+    Only meant for the first migration: compacted history is not in game_logs anymore.
+    """
+    conn.execute('DELETE FROM score_rollups')
+    conn.execute('DELETE FROM score_rollup_bins')
+    conn.execute(f'''
+        INSERT INTO score_rollups (period, bucket, game_type, plays, min_score, max_score, sum_score)
+        {_bucket_select('game_type, COUNT(*), MIN(score), MAX(score), SUM(score)', '1', 'GROUP BY 2, 3')}
+    ''')
+    conn.execute(f'''
+        INSERT INTO score_rollup_bins (period, bucket, game_type, bin, plays)
+        {_bucket_select('game_type, histogram_bin(game_type, score), COUNT(*)', '1', 'GROUP BY 2, 3, 4')}
+    ''')
+
+
+def get_score_trend(conn, game_type, period='day', start=None, end=None):
+    """
+    Per-bucket plays/min/max/mean/histogram for a game, oldest first.
+    start/end are inclusive dates (YYYY-MM-DD); weekly buckets are labelled
+    by their Monday, and a start date mid-week includes that whole week.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    if start:
+        start = conn.execute(f"SELECT {_bucket_expr(period, '?')}", (start,)).fetchone()[0]
+        if start is None:
+            raise ValueError("start must be a date (YYYY-MM-DD)")
+    bounds = (period, game_type, start or '', end or '9999')
+
+    rows = conn.execute('''
+        SELECT bucket, plays, min_score, max_score, sum_score
+        FROM score_rollups
+        WHERE period = ? AND game_type = ? AND bucket BETWEEN ? AND ?
+        ORDER BY bucket
+    ''', bounds).fetchall()
+    trend = {
+        row['bucket']: {
+            "bucket": row['bucket'],
+            "plays": row['plays'],
+            "min": row['min_score'],
+            "max": row['max_score'],
+            "mean": row['sum_score'] / row['plays'] if row['plays'] else None,
+            "histogram": [0] * HISTOGRAM_BINS,
+        }
+        for row in rows
+    }
+
+    for row in conn.execute('''
+        SELECT bucket, bin, plays
+        FROM score_rollup_bins
+        WHERE period = ? AND game_type = ? AND bucket BETWEEN ? AND ?
+    ''', bounds):
+        if row['bucket'] in trend:
+            trend[row['bucket']]["histogram"][row['bin']] = row['plays']
+
+    return list(trend.values())
+
+
+def get_user_history(conn, user_id, game_type, limit=50):
+    """
+    A player's most recent raw plays (within the retention window), newest first.
+    """
+    rows = conn.execute('''
+        SELECT score, created_at
+        FROM game_logs
+        WHERE user_id = ? AND game_type = ?
+        ORDER BY created_at DESC
+        LIMIT ?
+    ''', (user_id, game_type, limit))
+    return [dict(row) for row in rows]
+
+
+def compact_game_logs(conn, retention_days, max_log_id=None, chunk_size=10000):
+    """
+    Deletes raw game_logs rows older than retention_days; their plays live on
+    in the rollups. Rows above max_log_id are kept (e.g. not yet read into the
+    percentile sketches). Commits per chunk to keep write locks short.
+    Returns the number of rows deleted.
+    """
+    cutoff = conn.execute("SELECT datetime('now', ?)", (f'-{int(retention_days)} days',)).fetchone()[0]
+    if max_log_id is None:
+        max_log_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM game_logs').fetchone()[0]
+
+    deleted = 0
+    while True:
+        c = conn.execute('''
+            DELETE FROM game_logs WHERE id IN (
+                SELECT id FROM game_logs WHERE created_at < ? AND id <= ? LIMIT ?
+            )
+        ''', (cutoff, max_log_id, chunk_size))
+        conn.commit()
+        deleted += c.rowcount
+        if c.rowcount < chunk_size:
+            break
+
+    # Hand freed pages back to the OS (needs auto_vacuum=INCREMENTAL, see init_db)
+    conn.execute('PRAGMA incremental_vacuum').fetchall()
+    conn.commit()
+    return deleted
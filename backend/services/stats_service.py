@@ -1,5 +1,7 @@
 
-import scipy.stats as stats
+import math
+import os
+from services import quantile_sketch, instrumentation
 
 # Stats constants (Mean, Std Dev)
 # Stats constants (Mean, Std Dev)
@@ -26,6 +28,19 @@ STATS_DATA = {
     'sequence_hard': {'mean': 10, 'std_dev': 3.5, 'lower_is_better': False}
 }
 
+# 'normal': fixed mean/std_dev above. 'empirical': streaming sketches of real
+# game_logs, falling back to 'normal' for games with fewer than MIN_EMPIRICAL_SAMPLES plays.
+PERCENTILE_MODE = os.environ.get('BRAIN_PERCENTILE_MODE', 'normal')
+MIN_EMPIRICAL_SAMPLES = int(os.environ.get('BRAIN_MIN_EMPIRICAL_SAMPLES', 500))
+
+def normal_cdf(z):
+    """
+    Standard normal CDF, P(Z <= z).
+    """
+    return 0.5 * math.erfc(-z / math.sqrt(2))
+
+
+@instrumentation.timed('calculate_percentile')
 def calculate_percentile(game_type, score):
     """
     Calculates the percentile of a score relative to the population.
@@ -38,8 +53,16 @@ def calculate_percentile(game_type, score):
     std_dev = data['std_dev']
     lower_is_better = data.get('lower_is_better', False)
 
-    # CDF gives percentage of population scoring <= score.
-    cdf = stats.norm.cdf(score, loc=mean, scale=std_dev) * 100
+    cdf = None
+    if PERCENTILE_MODE == 'empirical':
+        cdf = quantile_sketch.empirical_cdf(game_type, score, MIN_EMPIRICAL_SAMPLES)
+
+    if cdf is not None:
+        cdf *= 100
+    else:
+        # CDF gives percentage of population scoring <= score.
+        # Closed-form normal CDF via erf; avoids scipy's import and per-call cost.
+        cdf = normal_cdf((score - mean) / std_dev) * 100
 
     if lower_is_better:
         # If lower is better (e.g. time), and I scored low, CDF is small.
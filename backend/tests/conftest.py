@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Must be set before db_service / ingest_service are first imported, so an
+# import can never touch backend/brain.db or backend/spool
+_session_dir = tempfile.mkdtemp(prefix='brain-tests-')
+os.environ['BRAIN_DB_PATH'] = os.path.join(_session_dir, 'brain.db')
+os.environ['BRAIN_INGEST_SPOOL_DIR'] = os.path.join(_session_dir, 'spool')
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """
+    A freshly initialized database that db_service connects to for this test.
+    """
+    import init_db
+    from services import db_service, rank_index
+
+    path = str(tmp_path / 'brain.db')
+    monkeypatch.setattr(init_db, 'DB_NAME', path)
+    with redirect_stdout(StringIO()):
+        init_db.init_db()
+    db_service.close_db_connection()
+    monkeypatch.setattr(db_service, 'DB_PATH', path)
+    # In-memory state that mirrors the database starts empty too
+    monkeypatch.setattr(rank_index, '_rankings', {})
+    yield path
+    db_service.close_db_connection()
@@ -0,0 +1,82 @@
+import random
+import sqlite3
+import threading
+
+import pytest
+
+from services import db_service
+from services.stats_service import STATS_DATA
+
+
+def _user_stats(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {(row[0], row[1]): row[2:] for row in conn.execute(
+            'SELECT user_id, game_type, best_score, total_plays, tier FROM user_stats')}
+
+
+def _workload(n=300, seed=3):
+    rng = random.Random(seed)
+    games = ['chimp_test', 'chimp_test_hard', 'reaction_time', 'n_back']
+    return [(f"user_{rng.randrange(8)}", rng.choice(games), float(rng.randint(0, 30)))
+            for _ in range(n)]
+
+
+def _expected(workload):
+    # Reference semantics: best score per lower_is_better, play count, tier of the best
+    expected = {}
+    for user_id, game_type, score in workload:
+        lower = STATS_DATA[game_type].get('lower_is_better', False)
+        best, plays, _ = expected.get((user_id, game_type), (score, 0, None))
+        best = min(best, score) if lower else max(best, score)
+        expected[(user_id, game_type)] = (best, plays + 1, db_service.determine_tier(game_type, best))
+    return expected
+
+
+def test_upsert_keeps_best_per_direction(db_path):
+    results = [db_service.save_game_result('a', 'chimp_test', s) for s in (5, 12, 8)]
+    assert [(r["new_best"], r["plays"], r["tier"]) for r in results] == [
+        (5, 1, 'Cat'), (12, 2, 'Chimp'), (12, 3, 'Chimp')]
+
+    results = [db_service.save_game_result('a', 'reaction_time', s) for s in (300, 250, 280)]
+    assert [(r["new_best"], r["plays"]) for r in results] == [(300, 1), (250, 2), (250, 3)]
+
+    # An explicit lower_is_better overrides STATS_DATA
+    for s in (7, 3, 5):
+        db_service.save_game_result('b', 'chimp_test', s, lower_is_better=True)
+    assert _user_stats(db_path)[('b', 'chimp_test')] == (3, 3, 'Shrimp')
+
+
+def test_single_commits_match_reference(db_path):
+    workload = _workload()
+    for user_id, game_type, score in workload:
+        assert db_service.save_game_result(user_id, game_type, score) is not None
+    assert _user_stats(db_path) == _expected(workload)
+
+
+def test_group_commit_matches_reference(db_path, monkeypatch):
+    monkeypatch.setattr(db_service, 'GROUP_COMMIT_MS', 5)
+    monkeypatch.setattr(db_service, '_group_writer', None)
+    workload = _workload()
+    results = [None] * len(workload)
+
+    def submit(indexes):
+        for i in indexes:
+            results[i] = db_service.save_game_result(*workload[i])
+
+    threads = [threading.Thread(target=submit, args=(range(t, len(workload), 6),)) for t in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(r is not None for r in results)
+    assert _user_stats(db_path) == _expected(workload)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM game_logs').fetchone()[0] == len(workload)
+
+
+def test_write_batch_reports_per_row_results(db_path):
+    params = [db_service.make_result_params('a', 'chimp_test', s) for s in (4, 11)]
+    results = db_service.write_batch(params)
+    assert [(r["new_best"], r["plays"], r["tier"]) for r in results] == [(4, 1, 'Shrimp'), (11, 2, 'Chimp')]
+    assert results[1]["rank"] == 1
@@ -0,0 +1,110 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from services import db_service, ingest_service
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch, db_path):
+    path = str(tmp_path / 'spool')
+    os.makedirs(path)
+    monkeypatch.setattr(ingest_service, 'SPOOL_DIR', path)
+    monkeypatch.setattr(ingest_service, 'RETRY_DELAY', 0.01)
+    return path
+
+
+def _line(user_id):
+    return (json.dumps(db_service.make_result_params(user_id, 'chimp_test', 7)) + '\n').encode()
+
+
+def _plays(db_path):
+    with sqlite3.connect(db_path) as conn:
+        logs = dict(conn.execute('SELECT user_id, COUNT(*) FROM game_logs GROUP BY user_id'))
+        stats = dict(conn.execute('SELECT user_id, total_plays FROM user_stats'))
+        offsets = conn.execute('SELECT COUNT(*) FROM ingest_spool').fetchone()[0]
+    return logs, stats, offsets
+
+
+def test_replay_after_torn_write(spool_dir, db_path):
+    spool = os.path.join(spool_dir, 'ingest-1-1.jsonl')
+    with open(spool, 'wb') as f:
+        f.write(_line('u0') + _line('u1') + b'{"user_id": "u2", "sco')  # crashed mid-write
+
+    queue = ingest_service.IngestQueue()
+    queue.stop()
+
+    logs, stats, offsets = _plays(db_path)
+    assert logs == {'u0': 1, 'u1': 1} and stats == {'u0': 1, 'u1': 1}
+    assert queue.get_stats()['replayed'] == 2
+    assert not os.path.exists(spool) and offsets == 0
+
+
+def test_replay_resumes_after_committed_offset(spool_dir, db_path):
+    name = 'ingest-1-1.jsonl'
+    with open(os.path.join(spool_dir, name), 'wb') as f:
+        f.write(_line('u0') + _line('u1'))
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('INSERT INTO ingest_spool (spool, committed_offset) VALUES (?, ?)', (name, len(_line('u0'))))
+
+    queue = ingest_service.IngestQueue()
+    queue.stop()
+
+    assert _plays(db_path)[0] == {'u1': 1}
+
+
+@pytest.mark.parametrize('message', ['database is locked', 'disk I/O error', 'database or disk is full',
+                                     'no such table: user_stats'])
+def test_transient_error_during_fallback_requeues_only_unwritten_rows(spool_dir, db_path, monkeypatch, message):
+    write_result = db_service._write_result
+    seen = []
+
+    def flaky(conn, params):
+        seen.append(params['user_id'])
+        if params['user_id'] == 'bad':
+            raise ValueError('bad row')
+        # The batch stops at 'bad', so u2 is first seen when rows are retried one by one
+        if params['user_id'] == 'u2' and seen.count('u2') == 1:
+            raise sqlite3.OperationalError(message)
+        return write_result(conn, params)
+
+    monkeypatch.setattr(db_service, '_write_result', flaky)
+    monkeypatch.setattr(db_service, 'LOCK_RETRIES', 0)
+
+    queue = ingest_service.IngestQueue()
+    with queue._cond:  # one batch
+        for user_id in ['u0', 'bad', 'u1', 'u2', 'u3']:
+            queue.submit(db_service.make_result_params(user_id, 'chimp_test', 7))
+    queue.stop()
+
+    logs, stats, offsets = _plays(db_path)
+    assert logs == {'u0': 1, 'u1': 1, 'u2': 1, 'u3': 1}
+    assert stats == logs
+    assert offsets == 0 and queue.get_stats()['rows_failed'] == 1
+    assert queue.get_stats()['flush_errors'] == 1  # the error did hit
+    with open(os.path.join(spool_dir, ingest_service.REJECTED_FILE)) as f:
+        assert [json.loads(line)["params"]["user_id"] for line in f] == ['bad']
+
+
+def test_batch_level_operational_error_rejects_nothing(spool_dir, db_path, monkeypatch):
+    write_result = db_service._write_result
+    failures = []
+
+    def full_disk_once(conn, params):
+        if not failures:
+            failures.append(params['user_id'])
+            raise sqlite3.OperationalError('database or disk is full')
+        return write_result(conn, params)
+
+    monkeypatch.setattr(db_service, '_write_result', full_disk_once)
+    queue = ingest_service.IngestQueue()
+    with queue._cond:
+        for user_id in ['u0', 'u1']:
+            queue.submit(db_service.make_result_params(user_id, 'chimp_test', 7))
+    queue.stop()
+
+    assert _plays(db_path)[0] == {'u0': 1, 'u1': 1}
+    assert queue.get_stats()['rows_failed'] == 0
+    assert not os.path.exists(os.path.join(spool_dir, ingest_service.REJECTED_FILE))
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+import pytest
+
+from services import leaderboard_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(leaderboard_cache, '_entries', OrderedDict())
+    monkeypatch.setattr(leaderboard_cache, '_generations', {})
+    monkeypatch.setattr(leaderboard_cache, '_stats', dict.fromkeys(leaderboard_cache._stats, 0))
+
+
+def test_put_then_hit_with_stable_etag():
+    body, etag, generation = leaderboard_cache.get('chimp_test')
+    assert body is None and etag is None
+    stored = leaderboard_cache.put('chimp_test', b'[1]', generation)
+    assert leaderboard_cache.get('chimp_test')[:2] == (b'[1]', stored)
+    assert stored == leaderboard_cache.make_etag(b'[1]')
+
+
+def test_read_that_raced_a_save_is_not_cached():
+    _, _, generation = leaderboard_cache.get('chimp_test')
+    leaderboard_cache.invalidate('chimp_test')  # a save committed while we were reading
+    leaderboard_cache.put('chimp_test', b'[stale]', generation)
+    body, _, newer = leaderboard_cache.get('chimp_test')
+    assert body is None
+    leaderboard_cache.put('chimp_test', b'[fresh]', newer)
+    assert leaderboard_cache.get('chimp_test')[0] == b'[fresh]'
+
+
+def test_invalidate_only_drops_that_game():
+    for game_type in ('a', 'b'):
+        leaderboard_cache.put(game_type, game_type.encode(), leaderboard_cache.get(game_type)[2])
+    leaderboard_cache.invalidate('a')
+    assert leaderboard_cache.get('a')[0] is None
+    assert leaderboard_cache.get('b')[0] == b'b'
+    assert leaderboard_cache.get_cache_stats()['invalidations'] == 1
+
+
+def test_ttl_expiry_and_lru_eviction(monkeypatch):
+    monkeypatch.setattr(leaderboard_cache, 'TTL_SECONDS', -1)
+    leaderboard_cache.put('a', b'a', 0)
+    assert leaderboard_cache.get('a')[0] is None
+
+    monkeypatch.setattr(leaderboard_cache, 'TTL_SECONDS', 30)
+    monkeypatch.setattr(leaderboard_cache, 'MAX_ENTRIES', 2)
+    for game_type in ('a', 'b'):
+        leaderboard_cache.put(game_type, game_type.encode(), 0)
+    leaderboard_cache.get('a')  # 'b' is now least recently used
+    leaderboard_cache.put('c', b'c', 0)
+    assert leaderboard_cache.get('b')[0] is None
+    assert leaderboard_cache.get('a')[0] == b'a' and leaderboard_cache.get('c')[0] == b'c'
+    assert leaderboard_cache.get_cache_stats()['evictions'] == 1
+
+
+def test_route_serves_304_and_never_caches_a_failed_read(monkeypatch, db_path):
+    import app
+
+    client = app.app.test_client()
+    monkeypatch.setattr(app, 'get_game_leaderboard', lambda game_type, limit: None)
+    assert client.get('/api/leaderboard?game_type=chimp_test').status_code == 503
+    assert leaderboard_cache.get_cache_stats()['entries'] == 0
+
+    monkeypatch.setattr(app, 'get_game_leaderboard', lambda game_type, limit: [{"user_id": "a"}])
+    first = client.get('/api/leaderboard?game_type=chimp_test')
+    assert first.status_code == 200 and first.get_json() == [{"user_id": "a"}]
+    again = client.get('/api/leaderboard?game_type=chimp_test', headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
@@ -0,0 +1,73 @@
+import pytest
+
+from services import percentile_engine, stats_service
+from services.percentile_engine import calculate_percentiles
+from services.stats_service import STATS_DATA, calculate_percentile
+
+# Standard normal CDF at a grid of z-scores, from scipy.stats.norm.cdf (the
+# implementation these functions replaced; scipy is no longer a dependency)
+SCIPY_NORM_CDF = {
+    -4: 3.167124183311986e-05,
+    -3: 0.0013498980316300933,
+    -2.5: 0.006209665325776132,
+    -2: 0.022750131948179195,
+    -1.5: 0.06680720126885807,
+    -1.25: 0.10564977366685535,
+    -1: 0.15865525393145707,
+    -0.75: 0.2266273523768682,
+    -0.5: 0.3085375387259869,
+    -0.3: 0.3820885778110474,
+    -0.1: 0.460172162722971,
+    0: 0.5,
+    0.1: 0.539827837277029,
+    0.3: 0.6179114221889526,
+    0.5: 0.6914624612740131,
+    0.6745: 0.7500032571363009,
+    0.75: 0.7733726476231317,
+    1: 0.8413447460685429,
+    1.2816: 0.9000084999023248,
+    1.5: 0.9331927987311419,
+    1.6449: 0.9500047825316537,
+    2: 0.9772498680518208,
+    2.3263: 0.9899987239832014,
+    2.5: 0.9937903346742238,
+    3: 0.9986501019683699,
+    4: 0.9999683287581669,
+}
+
+
+@pytest.fixture(autouse=True)
+def normal_mode(monkeypatch):
+    monkeypatch.setattr(stats_service, 'PERCENTILE_MODE', 'normal')
+
+
+def _reference_cases():
+    for game_type, data in STATS_DATA.items():
+        for z, cdf in SCIPY_NORM_CDF.items():
+            expected = 100 - cdf * 100 if data.get('lower_is_better') else cdf * 100
+            yield game_type, data['mean'] + z * data['std_dev'], round(expected, 2)
+
+
+def test_normal_cdf_matches_scipy():
+    for z, cdf in SCIPY_NORM_CDF.items():
+        assert stats_service.normal_cdf(z) == pytest.approx(cdf, rel=1e-12, abs=1e-15)
+    values = percentile_engine.normal_cdf_array([float(z) for z in SCIPY_NORM_CDF])
+    assert values.tolist() == pytest.approx(list(SCIPY_NORM_CDF.values()), abs=1e-9)
+
+
+def test_calculate_percentile_matches_scipy_for_every_game():
+    for game_type, score, expected in _reference_cases():
+        assert calculate_percentile(game_type, score) == expected, (game_type, score)
+
+
+def test_calculate_percentiles_matches_scipy_for_every_game():
+    game_types, scores, expected = zip(*_reference_cases())
+    assert calculate_percentiles(game_types, scores).tolist() == list(expected)
+
+
+def test_unknown_game_and_length_mismatch():
+    assert calculate_percentile('no_such_game', 10) == 0.0
+    assert calculate_percentiles(['no_such_game', 'chimp_test'], [10, STATS_DATA['chimp_test']['mean']]).tolist() \
+        == [0.0, 50.0]
+    with pytest.raises(ValueError):
+        calculate_percentiles(['chimp_test'], [1, 2])
@@ -0,0 +1,86 @@
+import bisect
+import random
+
+import pytest
+
+from services import quantile_sketch
+from services.quantile_sketch import KLLSketch
+
+
+def _exact_cdf(sorted_values, x):
+    # Same mid-rank convention as KLLSketch.cdf
+    lo = bisect.bisect_left(sorted_values, x)
+    hi = bisect.bisect_right(sorted_values, x)
+    return (lo + (hi - lo) / 2) / len(sorted_values)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_cdf_error_within_bound(seed):
+    rng = random.Random(seed)
+    values = [round(rng.gauss(250, 50) + rng.expovariate(0.05), 1) for _ in range(100000)]
+    sketch = KLLSketch(seed=seed)
+    for v in values:
+        sketch.update(v)
+    values.sort()
+
+    # Rank error ~1.7 / k in expectation; allow some headroom for the worst probe
+    bound = 3.0 / quantile_sketch.SKETCH_K
+    probes = [values[int(len(values) * q)] for q in [i / 100 for i in range(1, 100)]]
+    worst = max(abs(sketch.cdf(x) - _exact_cdf(values, x)) for x in probes)
+    assert worst < bound
+    assert sketch.cdf(values[0] - 1) == 0.0
+    assert sketch.cdf(values[-1] + 1) == 1.0
+
+
+def test_weights_preserve_count_and_size_stays_bounded():
+    sketch = KLLSketch(seed=4)
+    for i in range(50000):
+        sketch.update(i % 977)
+    _, cumulative = sketch.sorted_view()
+    assert cumulative[-1] == sketch.count == 50000
+    assert sum(len(c) for c in sketch.compactors) <= sketch.max_size
+    assert sum(len(c) for c in sketch.compactors) < 1000
+
+
+def test_small_sketch_is_exact():
+    sketch = KLLSketch()
+    for v in [1, 2, 2, 3]:
+        sketch.update(v)
+    assert sketch.cdf(2) == pytest.approx(0.5)
+    assert sketch.cdf(1) == pytest.approx(0.125)
+    assert KLLSketch().cdf(1) is None
+
+
+def test_json_round_trip():
+    sketch = KLLSketch(seed=5)
+    for i in range(20000):
+        sketch.update(i)
+    restored = KLLSketch.from_json(sketch.to_json())
+    assert restored.count == sketch.count
+    assert restored.sorted_view() == sketch.sorted_view()
+    restored.update(1)
+    assert restored.count == sketch.count + 1
+
+
+def test_apply_logs_skips_seen_rows_and_tracks_watermark(monkeypatch):
+    monkeypatch.setattr(quantile_sketch, '_state', {})
+    monkeypatch.setattr(quantile_sketch, '_scanned_through', 0)
+    monkeypatch.setattr(quantile_sketch, '_dirty', False)
+
+    assert quantile_sketch.apply_logs([(1, 'g', 10.0), (2, 'g', 20.0), (3, 'h', None)]) == 2
+    assert quantile_sketch.last_log_id() == 3
+    assert quantile_sketch.apply_logs([(2, 'g', 20.0), (4, 'g', 30.0)]) == 1
+    assert quantile_sketch.sample_count('g') == 3
+    assert quantile_sketch.empirical_cdf('g', 20.0, min_samples=3) == pytest.approx(0.5)
+    assert quantile_sketch.empirical_cdf('g', 20.0, min_samples=4) is None
+
+    rows = quantile_sketch.snapshot()
+    assert {row[0] for row in rows} == {'g', 'h'} and all(row[3] == 4 for row in rows)
+    assert quantile_sketch.snapshot() == []
+
+    # A restart restores the sketches and resumes after the stored watermark
+    monkeypatch.setattr(quantile_sketch, '_state', {})
+    quantile_sketch.load([(game_type, text, log_id) for game_type, text, _, log_id in rows])
+    assert quantile_sketch.last_log_id() == 4
+    assert quantile_sketch.apply_logs([(4, 'g', 30.0), (5, 'g', 40.0)]) == 1
+    assert quantile_sketch.sample_count('g') == 4
@@ -0,0 +1,127 @@
+import random
+
+from services.rank_index import GameRanking, IndexableSkiplist
+
+
+def test_skiplist_matches_sorted_list():
+    rng = random.Random(1)
+    skiplist = IndexableSkiplist()
+    expected = []
+    for _ in range(3000):
+        if expected and rng.random() < 0.3:
+            value = rng.choice(expected)
+            expected.remove(value)
+            skiplist.remove(value)
+        else:
+            value = (rng.randint(0, 200), rng.randint(0, 10 ** 6))
+            expected.append(value)
+            skiplist.insert(value)
+    expected.sort()
+
+    assert len(skiplist) == len(expected)
+    assert list(skiplist.iter_from(0)) == expected
+    for index in (0, 1, len(expected) // 2, len(expected) - 1, len(expected)):
+        assert list(skiplist.iter_from(index)) == expected[index:]
+    for probe in [(v, -1) for v in range(-1, 202, 7)]:
+        assert skiplist.count_less(probe) == sum(1 for v in expected if v < probe)
+
+
+def _brute_force(players, lower_is_better):
+    # Rows sorted best first with competition ranks (ties share, then skip)
+    key = (lambda item: (item[1], item[0])) if lower_is_better else (lambda item: (-item[1], item[0]))
+    ordered = sorted(players.items(), key=key)
+    rows = []
+    for user_id, score in ordered:
+        better = sum(1 for s in players.values() if (s < score if lower_is_better else s > score))
+        rows.append((user_id, score, better + 1))
+    return rows
+
+
+def _random_ranking(lower_is_better, seed):
+    rng = random.Random(seed)
+    ranking = GameRanking(lower_is_better)
+    players = {}
+    for _ in range(2000):
+        user_id = f"user_{rng.randrange(300)}"
+        score = rng.randint(0, 50)  # narrow range: plenty of ties
+        players[user_id] = score
+        ranking.update(user_id, score, {"user_id": user_id, "best_score": score})
+    return ranking, players
+
+
+def test_ranks_top_and_around_match_brute_force():
+    for lower_is_better in (False, True):
+        ranking, players = _random_ranking(lower_is_better, seed=2)
+        expected = _brute_force(players, lower_is_better)
+        as_rows = [(row["user_id"], row["best_score"], row["rank"]) for row in ranking.top(len(players))]
+
+        assert len(ranking) == len(players)
+        assert as_rows == expected
+        assert [(r["user_id"], r["rank"]) for r in ranking.top(10)] == [(u, rank) for u, _, rank in expected[:10]]
+        for position, (user_id, _, rank) in enumerate(expected):
+            assert ranking.rank(user_id) == rank
+            if position % 37 == 0:
+                start = max(0, position - 5)
+                around = [(r["user_id"], r["best_score"], r["rank"]) for r in ranking.around(user_id, 5)]
+                assert around == expected[start:position + 6]
+
+
+def test_update_returns_rank_and_moves_player():
+    ranking = GameRanking()
+    assert ranking.update('a', 10, {"user_id": 'a'}) == 1
+    assert ranking.update('b', 20, {"user_id": 'b'}) == 1
+    assert ranking.update('c', 20, {"user_id": 'c'}) == 1
+    assert ranking.rank('a') == 3
+    assert ranking.update('a', 30, {"user_id": 'a'}) == 1
+    assert ranking.rank('b') == 2 and ranking.rank('c') == 2
+    assert len(ranking) == 3
+    assert ranking.rank('missing') is None and ranking.around('missing') == []
+
+
+def test_stale_versioned_update_is_ignored():
+    ranking = GameRanking()
+    ranking.update('a', 30, {"best_score": 30, "total_plays": 2}, version=2)
+    ranking.update('b', 20, {"best_score": 20, "total_plays": 1}, version=1)
+    # An older save's _after_commit arriving late must not roll 'a' back
+    assert ranking.update('a', 10, {"best_score": 10, "total_plays": 1}, version=1) == 1
+    assert ranking.get('a')["best_score"] == 30
+    assert ranking.update('a', 35, {"best_score": 35, "total_plays": 3}, version=3) == 1
+    assert ranking.get('a')["best_score"] == 35
+
+
+def test_refresh_picks_up_other_workers_saves(db_path):
+    import sqlite3
+
+    from services import db_service, rank_index
+
+    db_service.write_batch([db_service.make_result_params('a', 'chimp_test', 10)])
+    db_service.warm_rank_index()
+
+    # Another worker's saves: a new player, and a better score for 'a'
+    other = sqlite3.connect(db_path)
+    other.execute("INSERT INTO user_stats (user_id, game_type, best_score, total_plays, tier) "
+                  "VALUES ('b', 'chimp_test', 12, 1, 'Chimp')")
+    other.execute("UPDATE user_stats SET best_score = 15, total_plays = 2, last_played_at = CURRENT_TIMESTAMP "
+                  "WHERE user_id = 'a'")
+    other.commit()
+    other.close()
+
+    assert rank_index.get_player_rank('chimp_test', 'b') is None
+    assert db_service.refresh_rank_index(force=True) == 2
+    assert rank_index.get_player_rank('chimp_test', 'b')["rank"] == 2
+    assert rank_index.get_ranking('chimp_test').get('a')["best_score"] == 15
+    # Re-reading the overlap window does not roll anything back
+    db_service.refresh_rank_index(force=True)
+    assert rank_index.get_ranking('chimp_test').get('a')["total_plays"] == 2
+    assert len(rank_index.get_ranking('chimp_test')) == 2
+
+
+def test_demo_submit_accepts_non_string_names(db_path):
+    import app
+
+    client = app.app.test_client()
+    seed = app.LEADERBOARD_DATA.top(1)[0]
+    # A numeric name tying an existing score must not compare int with str
+    response = client.post('/api/submit-score', json={"name": 12345, "score": seed["score"]})
+    assert response.status_code == 200
+    assert response.get_json()["rank"] == 1
@@ -0,0 +1,150 @@
+import sqlite3
+
+import pytest
+
+from services import db_service, quantile_sketch, rollup_service, stats_service
+from services.rollup_service import PERIODS
+
+
+@pytest.fixture
+def fresh_sketches(monkeypatch):
+    # Module state as in a newly started process
+    monkeypatch.setattr(quantile_sketch, '_state', {})
+    monkeypatch.setattr(quantile_sketch, '_scanned_through', 0)
+    monkeypatch.setattr(quantile_sketch, '_dirty', False)
+
+
+def _save(scores, game_type='reaction_time'):
+    return db_service.write_batch([db_service.make_result_params(f"user_{i}", game_type, score)
+                                   for i, score in enumerate(scores)])
+
+
+def _backdate(db_path, days):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE game_logs SET created_at = datetime('now', ?)", (f'-{days} days',))
+
+
+def _persisted(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute('SELECT sample_count, last_log_id FROM percentile_sketches '
+                            "WHERE game_type = 'reaction_time'").fetchone()
+
+
+def test_compaction_in_fresh_process_keeps_persisted_sketches(db_path, monkeypatch, fresh_sketches):
+    monkeypatch.setattr(stats_service, 'PERCENTILE_MODE', 'empirical')
+    _save([200 + i for i in range(50)])
+    db_service.sync_sketches()
+    db_service.persist_sketches()
+    _backdate(db_path, 200)
+    assert db_service.compact_game_logs(90) == 50
+    assert _persisted(db_path) == (50, 50)
+
+    # Cron run: new process, sketches never loaded, a few raw rows left
+    monkeypatch.setattr(quantile_sketch, '_state', {})
+    monkeypatch.setattr(quantile_sketch, '_scanned_through', 0)
+    _save([300, 301])
+    _backdate(db_path, 200)
+    deleted = db_service.compact_game_logs(90)
+
+    assert _persisted(db_path) == (50, 50)
+    # Rows the persisted sketches have not read yet must survive compaction
+    assert deleted == 0
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM game_logs').fetchone()[0] == 2
+
+
+def test_history_route_clamps_limit(db_path):
+    import app
+
+    db_service.write_batch([db_service.make_result_params('a', 'chimp_test', s) for s in (5, 6, 7)])
+    client = app.app.test_client()
+    assert len(client.get('/api/history?user_id=a&game_type=chimp_test&limit=-1').get_json()) == 1
+    assert len(client.get('/api/history?user_id=a&game_type=chimp_test&limit=2').get_json()) == 2
+
+
+def _play_at(conn, created_at, score, game_type='chimp_test', user_id='a'):
+    c = conn.execute('INSERT INTO game_logs (user_id, game_type, score, created_at) VALUES (?, ?, ?, ?)',
+                     (user_id, game_type, score, created_at))
+    rollup_service.record_play(conn, {"log_id": c.lastrowid})
+
+
+NEW_YEAR_WEEK = [
+    ('2025-12-29 08:00:00', 4),   # Monday
+    ('2025-12-31 23:59:59', 9),
+    ('2026-01-01 00:00:00', 12),
+    ('2026-01-04 23:00:00', 3),   # Sunday: still the same week
+    ('2026-01-05 00:10:00', 7),   # next Monday
+]
+
+
+@pytest.fixture
+def new_year_plays(db_path):
+    conn = db_service.get_db_connection()
+    for created_at, score in NEW_YEAR_WEEK:
+        _play_at(conn, created_at, score)
+    conn.commit()
+    return conn
+
+
+def _rollups(conn):
+    return (conn.execute('SELECT * FROM score_rollups ORDER BY 1, 2, 3').fetchall(),
+            conn.execute('SELECT * FROM score_rollup_bins ORDER BY 1, 2, 3, 4').fetchall())
+
+
+def test_week_spanning_new_year_is_one_bucket(new_year_plays):
+    trend = rollup_service.get_score_trend(new_year_plays, 'chimp_test', 'week')
+    assert [(t["bucket"], t["plays"], t["min"], t["max"]) for t in trend] == [
+        ('2025-12-29', 4, 3, 12),
+        ('2026-01-05', 1, 7, 7),
+    ]
+    assert trend[0]["mean"] == pytest.approx((4 + 9 + 12 + 3) / 4)
+    assert [sum(t["histogram"]) for t in trend] == [4, 1]
+
+
+def test_day_buckets_and_histogram_bins(new_year_plays):
+    trend = rollup_service.get_score_trend(new_year_plays, 'chimp_test', 'day')
+    assert [t["bucket"] for t in trend] == ['2025-12-29', '2025-12-31', '2026-01-01', '2026-01-04', '2026-01-05']
+    for t, (_, score) in zip(trend, NEW_YEAR_WEEK):
+        assert t["plays"] == 1 and t["min"] == t["max"] == score
+        assert t["histogram"][rollup_service.histogram_bin('chimp_test', score)] == 1
+
+
+def test_incremental_rollups_match_rebuild(new_year_plays):
+    conn = new_year_plays
+    for i in range(40):
+        _play_at(conn, f'2026-02-{1 + i % 20:02d} 12:00:00', i % 25, game_type=('chimp_test', 'n_back')[i % 2])
+    conn.commit()
+    incremental = _rollups(conn)
+    rollup_service.rebuild_rollups(conn)
+    conn.commit()
+    assert _rollups(conn) == incremental
+
+
+def test_trend_bounds(new_year_plays):
+    conn = new_year_plays
+    # A start date mid-week includes that whole week
+    weeks = rollup_service.get_score_trend(conn, 'chimp_test', 'week', start='2026-01-02')
+    assert [t["bucket"] for t in weeks] == ['2025-12-29', '2026-01-05']
+    weeks = rollup_service.get_score_trend(conn, 'chimp_test', 'week', start='2026-01-05')
+    assert [t["bucket"] for t in weeks] == ['2026-01-05']
+    days = rollup_service.get_score_trend(conn, 'chimp_test', 'day', start='2025-12-31', end='2026-01-01')
+    assert [t["bucket"] for t in days] == ['2025-12-31', '2026-01-01']
+    with pytest.raises(ValueError):
+        rollup_service.get_score_trend(conn, 'chimp_test', 'week', start='not-a-date')
+    with pytest.raises(ValueError):
+        rollup_service.get_score_trend(conn, 'chimp_test', 'month')
+
+
+def test_chunked_compaction_keeps_trend_totals(new_year_plays):
+    conn = new_year_plays
+    recent = conn.execute("SELECT datetime('now')").fetchone()[0]
+    _play_at(conn, recent, 8)
+    conn.commit()
+    before = {period: rollup_service.get_score_trend(conn, 'chimp_test', period) for period in PERIODS}
+    last_old_id = conn.execute('SELECT MAX(id) FROM game_logs WHERE created_at < ?', (recent,)).fetchone()[0]
+
+    # max_log_id keeps the newest old row
+    assert rollup_service.compact_game_logs(conn, 1, max_log_id=last_old_id - 1, chunk_size=2) == 4
+    assert rollup_service.compact_game_logs(conn, 1, chunk_size=2) == 1
+    assert [tuple(row) for row in conn.execute('SELECT created_at FROM game_logs')] == [(recent,)]
+    assert {period: rollup_service.get_score_trend(conn, 'chimp_test', period) for period in PERIODS} == before